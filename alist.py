@@ -1,8 +1,17 @@
 import os
+import mmap
+import array
 import pickle
+import struct
 import flock
 
 
+head_format = "<QQ"
+head_size = struct.calcsize(head_format)
+
+index_format = "<Q"
+index_size = struct.calcsize(index_format)
+
 def mkfile (*names):
     for fname in map(os.path.realpath, names):
         if not os.path.exists(fname):
@@ -13,6 +22,98 @@ def commit (file):
     file.flush()
     os.fsync(file.fileno())
 
+def stamp (fname):
+    try:
+        stat = os.stat(fname)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+def remap (file, mem):
+    size = os.fstat(file.fileno()).st_size
+
+    if mem is not None and len(mem) == size:
+        return mem
+
+    if mem is not None:
+        mem.close()
+
+    if not size:
+        return None
+
+    return mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+
+def index_name (fname):
+    return fname + ".index"
+
+def scan_locked (file, start=0):
+    offsets = array.array("Q")
+    file.seek(start, os.SEEK_SET)
+
+    while True:
+        offset = file.tell()
+
+        try:
+            pickle.load(file)
+        except (EOFError, pickle.UnpicklingError):
+            break
+
+        offsets.append(offset)
+
+    return offsets
+
+def read_head (fname):
+    try:
+        with open(index_name(fname), "rb") as index:
+            head = index.read(head_size)
+            isize = os.fstat(index.fileno()).st_size
+
+    except FileNotFoundError:
+        return None, 0, 0
+
+    if len(head) < head_size:
+        return None, 0, 0
+
+    size, generation = struct.unpack(head_format, head)
+
+    return size, generation, (isize - head_size) // index_size
+
+def index_count (file):
+    size, _, count = read_head(file.name)
+
+    if size != os.fstat(file.fileno()).st_size:
+        return None
+
+    return count
+
+def index_offsets (file, positions):
+    with open(index_name(file.name), "rb") as index:
+        for pos in positions:
+            index.seek(head_size + pos * index_size, os.SEEK_SET)
+            yield struct.unpack(index_format, index.read(index_size))[0]
+
+def index_locked (file, start, offsets, end):
+    iname = index_name(file.name)
+    size, generation, _ = read_head(file.name)
+    mkfile(iname)
+
+    with open(iname, "rb+") as index:
+        if size != start:
+            offsets = scan_locked(file)
+            file.seek(end, os.SEEK_SET)
+            generation += 1
+
+            index.truncate(0)
+            index.write(struct.pack(head_format, 0, generation))
+
+        index.seek(0, os.SEEK_END)
+        index.write(array.array("Q", offsets).tobytes())
+
+        index.seek(0, os.SEEK_SET)
+        index.write(struct.pack(head_format, end, generation))
+        commit(index)
+
 def iterate_locked (file):
     while True:
         try:
@@ -48,13 +149,28 @@ def read (fname, shared=True):
 
     return result
 
-def write_locked (file, *data, flush=True):
+def write_locked (file, *data, flush=True, keys=None):
+    start = file.tell()
+    offsets = []
+
+    if keys is not None:
+        keys.sync_locked(file, start)
+
     for value in data:
+        offsets.append(file.tell())
         pickle.dump(value, file)
 
     if flush:
         commit(file)
 
+    index_locked(file, start, offsets, file.tell())
+
+    if keys is not None:
+        keys.extend(data, file.tell())
+
+        if flush:
+            keys.flush()
+
     return len(data)
 
 def write (fname, *data, create=True):
@@ -69,3 +185,96 @@ def write (fname, *data, create=True):
             written = write_locked(file, *data)
 
     return written
+
+class view (object):
+
+    __slots__ = [
+        "fname", "count", "size", "generation", "offsets", "cache", "shared",
+        "mem"
+    ]
+
+    def __init__ (self, fname, shared=False):
+        self.fname = fname
+        self.count = 0
+        self.size = 0
+        self.generation = None
+        self.offsets = None
+        self.cache = {}
+        self.shared = shared
+        self.mem = None
+
+        self.refresh()
+
+    def refresh (self):
+        with open(self.fname, "rb") as file:
+            with flock.flock(file, shared=True):
+                fsize = os.fstat(file.fileno()).st_size
+                size, generation, count = read_head(self.fname)
+                rewritten = fsize < self.size
+
+                if size == fsize:
+                    rewritten |= generation != self.generation
+                    self.generation = generation
+                    self.offsets = None
+                    self.count = count
+
+                elif self.offsets is None or rewritten:
+                    rewritten = True
+                    self.generation = None
+                    self.offsets = scan_locked(file)
+                    self.count = len(self.offsets)
+
+                else:
+                    self.offsets.extend(scan_locked(file, self.size))
+                    self.count = len(self.offsets)
+
+                self.size = fsize
+
+        if rewritten:
+            self.cache = {}
+
+        return rewritten
+
+    def select (self, positions):
+        self.cache = {
+            pos : self.cache[pos] for pos in positions if pos in self.cache
+        }
+
+        missing = sorted(set(positions).difference(self.cache))
+
+        if not missing:
+            return
+
+        with open(self.fname, "rb") as file:
+            with flock.flock(file, shared=True):
+                if self.shared:
+                    self.mem = remap(file, self.mem)
+
+                if self.offsets is None:
+                    offsets = index_offsets(file, missing)
+                else:
+                    offsets = ( self.offsets[pos] for pos in missing )
+
+                for pos, offset in zip(missing, offsets):
+                    self.cache[pos] = self.load(file, offset)
+
+    def load (self, file, offset):
+        if self.mem is None:
+            file.seek(offset, os.SEEK_SET)
+            return pickle.load(file)
+
+        return pickle.loads(memoryview(self.mem)[ offset : ])
+
+    def close (self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+    def __len__ (self):
+        return self.count
+
+    def __getitem__ (self, pos):
+        if pos not in self.cache:
+            self.select([ *self.cache, pos ])
+
+        return self.cache[pos]
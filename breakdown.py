@@ -0,0 +1,379 @@
+import os
+import math
+import mmap
+import time
+import pickle
+import struct
+
+import scan
+import util
+import alist
+import flock
+import table
+import config
+import shards
+import summary
+import generate
+import runtimes
+
+
+select_size = 10000
+bin_scale = 16
+recent_buckets = 30
+
+seen_format = "<Q"
+seen_head = struct.calcsize(seen_format)
+
+def test_index (flags):
+    for index, test in enumerate(config.tests):
+        if all(
+            key in flags and generate.has(opts, flags[key])
+                for key, opts in test
+        ):
+            return index + 1
+
+    return 0
+
+def value_label (key, val):
+    return " ".join(txt for txt in config.log_format(key, val) if txt) or "-"
+
+def group_label (task):
+    flags = dict(task)
+
+    return " ".join(
+        txt for key in config.group_keys if key in flags
+            for txt in config.log_format(key, flags[key]) if txt
+    ) or "-"
+
+def new_stats ():
+    return [ 0, 0, 0.0, 0, 0.0 ]
+
+def add_runtime (stats, runtime):
+    stats[2] += runtime
+    stats[3] += 1
+    stats[4] += runtime * runtime
+
+def moments (stats):
+    mean = stats[2] / stats[3]
+    return mean, max(0.0, stats[4] / stats[3] - mean * mean)
+
+def runtime_bin (runtime):
+    return round(bin_scale * math.log2(max(runtime, 1e-6)))
+
+def recent_bucket (when):
+    return int(when * recent_buckets // config.rate_window)
+
+class bitmap (object):
+
+    __slots__ = [ "file", "mem" ]
+
+    def __init__ (self, fname):
+        alist.mkfile(fname)
+        self.file = open(fname, "rb+")
+        self.mem = None
+
+    def grow (self, count):
+        size = seen_head + (count + 7) // 8
+
+        if os.fstat(self.file.fileno()).st_size < size:
+            os.ftruncate(self.file.fileno(), size)
+
+        if self.mem is None or len(self.mem) < size:
+            self.unmap()
+            self.mem = mmap.mmap(self.file.fileno(), 0)
+
+    def reset (self):
+        self.unmap()
+        os.ftruncate(self.file.fileno(), 0)
+
+    def unmap (self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+    def close (self):
+        if self.mem is not None:
+            self.mem.flush()
+
+        self.unmap()
+        self.file.close()
+
+    def marked (self):
+        data = os.pread(self.file.fileno(), seen_head, 0)
+
+        if len(data) < seen_head:
+            return 0
+
+        return struct.unpack(seen_format, data)[0]
+
+    def commit (self, positions, marked):
+        for pos in positions:
+            self.mem[seen_head + (pos >> 3)] |= 1 << (pos & 7)
+
+        self.mem.flush()
+        struct.pack_into(seen_format, self.mem, 0, marked)
+        self.mem.flush()
+
+    def __contains__ (self, pos):
+        return self.mem[seen_head + (pos >> 3)] >> (pos & 7) & 1
+
+class breakdown (object):
+
+    __slots__ = [
+        "count", "group_keys", "keys", "labels", "test_stats", "value_stats",
+        "group_stats", "runtime_stats", "bins", "first", "recent", "blocks",
+        "marked", "offset"
+    ]
+
+    def __init__ (self):
+        self.count = 0
+        self.group_keys = list(config.group_keys)
+        self.keys = []
+        self.labels = []
+        self.test_stats = [ new_stats() ]
+        self.value_stats = []
+        self.group_stats = {}
+        self.runtime_stats = new_stats()
+        self.bins = {}
+        self.first = None
+        self.recent = {}
+        self.blocks = []
+        self.marked = 0
+        self.offset = 0
+
+    def key_index (self, key):
+        if key not in self.keys:
+            self.keys.append(key)
+            self.labels.append({})
+            self.value_stats.append([ None ])
+
+        return self.keys.index(key)
+
+    def value_index (self, kid, label):
+        labels = self.labels[kid]
+
+        if label not in labels:
+            labels[label] = len(labels) + 1
+            self.value_stats[kid].append(new_stats())
+
+        return labels[label]
+
+    def stats (self, task):
+        test = test_index(dict(task))
+
+        while len(self.test_stats) <= test:
+            self.test_stats.append(new_stats())
+
+        yield self.test_stats[test]
+
+        for key, val in task:
+            kid = self.key_index(key)
+            yield self.value_stats[kid][self.value_index(
+                kid, value_label(key, val)
+            )]
+
+        yield self.group_stats.setdefault(group_label(task), new_stats())
+
+    def tasks (self, data, positions):
+        for start in range(0, len(positions), select_size):
+            batch = positions[ start : start + select_size ]
+            data.select(batch)
+
+            for pos in batch:
+                yield self.stats(data[pos])
+
+    def tag_queue (self, data):
+        for stats in self.tasks(data, range(self.count, len(data))):
+            for stat in stats:
+                stat[0] += 1
+
+        self.count = max(self.count, len(data))
+
+    def mark_done (self, data, shard_files, seen):
+        num = len(shard_files)
+        marked = []
+
+        seen.grow(self.count)
+
+        while len(self.blocks) < num:
+            self.blocks.append([])
+
+        for shard, ( done_path, summary_path ) in enumerate(shard_files):
+            if not os.path.exists(done_path) or \
+               not os.path.getsize(done_path):
+                continue
+
+            blocks = self.blocks[shard]
+            found = summary.read_blocks(summary_path, summary.DONE)
+
+            with open(done_path, "rb") as done, \
+                 util.mapped(done, mmap.ACCESS_READ) as mem:
+
+                total = util.slot_count(len(mem))
+
+                if found is None or found[0] != total:
+                    found = total, [ None ] * summary.num_blocks(total)
+
+                blocks.extend([ 0 ] * (len(found[1]) - len(blocks)))
+
+                for block, amount in enumerate(found[1]):
+                    if amount is not None and amount == blocks[block]:
+                        continue
+
+                    start, end = summary.block_range(block, total)
+                    blocks[block] += self.mark_block(
+                        mem, seen, shard, num, start, end, marked
+                    )
+
+        for stats in self.tasks(data, marked):
+            for stat in stats:
+                stat[1] += 1
+
+        self.marked += len(marked)
+
+        return marked
+
+    def mark_block (self, mem, seen, shard, num, start, end, marked):
+        amount = 0
+
+        for local in scan.select(mem, start, end, scan.DONE):
+            pos = shards.position(shard, local, num)
+
+            if pos >= self.count or pos in seen:
+                continue
+
+            marked.append(pos)
+            amount += 1
+
+        return amount
+
+    def add_runtimes (self, data, now):
+        records, self.offset = runtimes.read_from(
+            config.files.runtimes, self.offset
+        )
+
+        for _, wid, end, runtime in records:
+            add_runtime(self.runtime_stats, runtime)
+            key = runtime_bin(runtime)
+            self.bins[key] = self.bins.get(key, 0) + 1
+            recent = self.recent.setdefault(
+                ( recent_bucket(end), wid ), [ 0, 0.0 ]
+            )
+
+            recent[0] += 1
+            recent[1] += runtime
+
+            if self.first is None or end - runtime < self.first:
+                self.first = end - runtime
+
+        oldest = recent_bucket(now - config.rate_window)
+
+        self.recent = {
+            key : val for key, val in self.recent.items() if key[0] >= oldest
+        }
+
+        records = [ record for record in records if record[0] < self.count ]
+        found = self.tasks(data, [ pos for pos, _, _, _ in records ])
+
+        for ( _, _, _, runtime ), stats in zip(records, found):
+            for stat in stats:
+                add_runtime(stat, runtime)
+
+    def quantile (self, q):
+        seen = 0
+
+        for key, amount in sorted(self.bins.items()):
+            seen += amount
+
+            if seen > q * self.runtime_stats[3]:
+                break
+
+        return 2 ** (key / bin_scale)
+
+    def refresh (self, shard_files, seen, now):
+        data = table.open_view(config.files.data)
+
+        try:
+            self.tag_queue(data)
+            marked = self.mark_done(data, shard_files, seen)
+            self.add_runtimes(data, now)
+
+        finally:
+            data.close()
+
+        return marked
+
+def update (shard_files, now=None):
+    now = time.time() if now is None else now
+    alist.mkfile(config.files.breakdown)
+
+    with open(config.files.breakdown, "rb+") as file:
+        with flock.flock(file):
+            seen = bitmap(config.files.seen)
+
+            try:
+                state = pickle.load(file)
+
+            except (EOFError, AttributeError, pickle.UnpicklingError):
+                state = None
+
+            try:
+                if state is None or \
+                   state.group_keys != list(config.group_keys) or \
+                   state.marked != seen.marked():
+
+                    state = breakdown()
+                    seen.reset()
+
+                marked = state.refresh(shard_files, seen, now)
+
+                file.seek(0, os.SEEK_SET)
+                file.truncate()
+                pickle.dump(state, file)
+                alist.commit(file)
+
+                seen.commit(marked, state.marked)
+
+            finally:
+                seen.close()
+
+    return state
+
+def format_stats (label, stats):
+    total, done, runtime, runs, _ = stats
+    perc = 100 * done / total if total else 100.0
+    out = "{}: {} / {} = {:.2f}%".format(label, done, total, perc)
+
+    if runs:
+        out += " mean {:.5f}s".format(runtime / runs)
+
+    return out
+
+def report (state):
+    lines = []
+
+    for index, stats in enumerate(state.test_stats):
+        if stats[0]:
+            label = "test {}".format(index) if index else "other"
+            lines.append(format_stats(label, stats))
+
+    for kid, key in enumerate(state.keys):
+        if len(state.labels[kid]) < 2:
+            continue
+
+        found = sorted(
+            state.labels[kid].items(),
+            key=lambda x: state.value_stats[kid][x[1]][1] /
+                max(1, state.value_stats[kid][x[1]][0])
+        )
+
+        for label, vid in found[ : config.max_groups ]:
+            stats = state.value_stats[kid][vid]
+            lines.append("  " + format_stats(label, stats))
+
+        if len(found) > config.max_groups:
+            lines.append("  ... +{} values of {}".format(
+                len(found) - config.max_groups, key
+            ))
+
+    return "\n".join(lines)
@@ -10,13 +10,54 @@ from defines import *
 set_task_path("task")
 
 num_tasks = 50
+min_tasks = 1
+max_tasks = 1000
+num_shards = 1
+num_done = 10
+gen_chunk = 100000
+gen_seed = 0
+gen_jobs = 1
+gen_block = 1000
+queue_format = "table"
+shared_queue = False
+concurrency = 1
+concurrency_async = 100
+pool = "thread"
 time_wait = 15
 time_starve = 15
+time_done = 1
+time_alive = 1
+time_lease = 30
+time_beat = 5
+time_hung = 0
+time_batch = 60
+time_poll = 1
+time_log_sync = 1
+time_sample = 1
+
+adaptive = False
+claim_alpha = 0.2
+steal = True
+speculate = False
+time_straggle = 60
+straggle_factor = 2
+
+liveness = "flock"
+wakeup = "inotify"
+log_sync = "batch"
+log_segments = False
+log_journal = False
 
 max_busy = 5
 max_recv = 15
+max_rates = 10
+max_groups = 10
 
-unique_busy = True
+pro_history = 120
+rate_halflife = 60
+rate_window = 300
+eta_quantiles = 0.5, 0.9, 0.99
+group_keys = [ "param1" ]
 
 ts_format = "%H:%M:%S"
 rt_format = "%H:%M:%S"
@@ -25,6 +66,8 @@ colors = "034", "056", "142", "126", "117", "088", "022", "069", "053", "181"
 recv_free = "070"
 recv_mine = "178"
 recv_dead = "124"
+recv_stolen = "033"
+recv_spec = "165"
 
 defaults = [
     ( "param1"   , "a" ),
@@ -1,41 +1,79 @@
 import os
+import struct
 import collections as cl
 
 
 ENABLE = True
 DISABLE = False
 
-use_bytes = 2
+use_bytes = 4
 use_order = "little"
-pro_format = "<QQQd"
+wid_bytes = 8
+pro_format = "<QQQddQ"
+pro_sample = "<dQ"
+runtime_format = "<QQdd"
+journal_format = "<BBdQQQd"
 
 sep_byte = b"\xaa"
+run_byte = b"\xab"
 free_byte = b"\x00"
 done_byte = b"\xff"
 
-free = free_byte * use_bytes
-done = done_byte * use_bytes
+done_magic = b"EVDN"
+done_version = 2
+done_head = "<4sHH"
 
-sep_free = sep_byte + free
-sep_done = sep_byte + done
+queue_magic = b"EVQT"
+queue_version = 2
+queue_head = "<4sHHQ"
+queue_cell = "H"
 
-one_size = len(sep_byte) + use_bytes
+block_slots = 4096
+sum_head = "<QQQQQ"
+sum_block = "<III"
+shard_format = "<Q"
+lease_format = "<d"
+
+class slot_t (object):
+    __slots__ = [
+        "version", "width", "head", "size",
+        "free", "done", "sep_free", "sep_done", "sep_run"
+    ]
 
 class paths_t (object):
-    __slots__ = [ "task", "lock" ]
+    __slots__ = [ "task", "lock", "logs" ]
 
 class files_t (object):
-    __slots__ = [ "wid", "done", "data", "log", "progress", "translate" ]
+    __slots__ = [ "wid", "done", "data", "log", "progress", "translate",
+                  "summary", "shards", "leases", "events",
+                  "grids", "runtimes", "breakdown", "seen", "journal" ]
 
+slot = slot_t()
 paths = paths_t()
 files = files_t()
 
+def set_layout (version=done_version, width=use_bytes):
+    global slot
+
+    slot.version = version
+    slot.width = width
+    slot.head = struct.calcsize(done_head) if version else 0
+    slot.size = len(sep_byte) + width
+
+    slot.free = free_byte * width
+    slot.done = done_byte * width
+
+    slot.sep_free = sep_byte + slot.free
+    slot.sep_done = sep_byte + slot.done
+    slot.sep_run = run_byte if version >= 2 else sep_byte
+
 def set_task_path (path):
     global paths
     global files
 
     paths.task = os.path.realpath(path)
     paths.lock = os.path.join(paths.task, "locks")
+    paths.logs = os.path.join(paths.task, "logs")
 
     files.wid = os.path.join(paths.task, "id")
     files.done = os.path.join(paths.task, "done")
@@ -43,3 +81,14 @@ def set_task_path (path):
     files.log = os.path.join(paths.task, "log.out")
     files.progress = os.path.join(paths.task, "progress")
     files.translate = os.path.join(paths.task, "translate")
+    files.summary = os.path.join(paths.task, "summary")
+    files.shards = os.path.join(paths.task, "shards")
+    files.leases = os.path.join(paths.task, "leases")
+    files.events = os.path.join(paths.task, "events")
+    files.grids = os.path.join(paths.task, "grids")
+    files.runtimes = os.path.join(paths.task, "runtimes")
+    files.breakdown = os.path.join(paths.task, "breakdown")
+    files.seen = os.path.join(paths.task, "breakdown.seen")
+    files.journal = os.path.join(paths.task, "journal")
+
+set_layout()
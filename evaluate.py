@@ -5,20 +5,29 @@ import sys
 import math
 import time
 import queue
+import asyncio
+import argparse
 import datetime
+import contextlib
 import threading
 import itertools as it
 import collections as cl
+import multiprocessing as mp
 
+import logs
 import flock
+import journal
 import alist
 import config
 import worker
 
 
-def get_many (aqueue, block_first=False):
+def get_many (aqueue, block_first=False, timeout=None):
     if block_first:
-        yield aqueue.get()
+        try:
+            yield aqueue.get(timeout=timeout)
+        except queue.Empty:
+            return
 
     while True:
         try:
@@ -27,46 +36,94 @@ def get_many (aqueue, block_first=False):
         except queue.Empty:
             break
 
-def async_printer (fname, aqueue):
-    if fname == os.devnull:
+def append (file, data, lock, sync):
+    with contextlib.ExitStack() as stack:
+        if lock:
+            stack.enter_context(flock.flock(file))
+
+        file.seek(0, os.SEEK_END)
+        file.write(data)
+        file.flush()
+
+        if sync == "batch":
+            os.fsync(file.fileno())
+
+def async_printer (
+    fname, aqueue, sync=config.log_sync, segment=False, events=None
+):
+    if fname == os.devnull and events is None:
         return
 
-    alist.mkfile(fname)
+    with contextlib.ExitStack() as stack:
+        log = jour = None
+
+        if fname != os.devnull:
+            if segment:
+                fname = logs.segment_name()
+
+            alist.mkfile(fname)
+            log = stack.enter_context(open(fname, "r+"))
+
+        if events is not None:
+            alist.mkfile(events)
+            jour = stack.enter_context(open(events, "rb+"))
 
-    with open(fname, "r+") as log:
         stop = False
+        fresh = True
+        synced = True
+        last_sync = time.monotonic()
 
         while not stop:
-            buffer = []
+            batch = []
+            timeout = None
+
+            if not synced:
+                timeout = max(
+                    0, last_sync + config.time_log_sync - time.monotonic()
+                )
 
-            for data in get_many(aqueue, True):
+            for data in get_many(aqueue, True, timeout):
                 stop = data is None
 
                 if stop:
                     break
 
-                buffer.append(data)
+                batch.append(data)
+
+            if batch and log is not None:
+                text = "".join(map(render, batch))
+
+                if segment:
+                    text, fresh = logs.stamp_lines(text, fresh, time.time())
+
+                append(log, text, not segment, sync)
+
+            if batch and jour is not None:
+                append(jour, b"".join(map(journal.encode, batch)), True, sync)
+
+            if batch:
+                synced = sync != "group"
 
-            if buffer:
-                with flock.flock(log):
-                    log.seek(0, os.SEEK_END)
+            now = time.monotonic()
+            due = now - last_sync >= config.time_log_sync
 
-                    for args, kwargs in buffer:
-                        print(*args, **kwargs, file=log)
+            if not synced and (stop or due):
+                for file in ( log, jour ):
+                    if file is not None:
+                        os.fsync(file.fileno())
 
-                    alist.commit(log)
+                synced = True
+                last_sync = now
 
-def get_ts ():
-    return datetime.datetime.now().strftime(config.ts_format)
+def get_ts (when):
+    return datetime.datetime.fromtimestamp(when).strftime(config.ts_format)
 
 def get_rt (val):
     return datetime.datetime.utcfromtimestamp(val).strftime(config.rt_format)
 
-def aprint (*args, aqueue, ts=True, **kwargs):
-    if ts:
-        args = ( "[{}]".format(get_ts()), *args )
-
-    aqueue.put(( args, kwargs ))
+def emit (kind, worker, *args, aqueue):
+    if aqueue is not None:
+        aqueue.put(( kind, worker.id, time.time(), *args ))
 
 def beautify (data):
     colors = it.cycle(config.colors)
@@ -92,100 +149,207 @@ def color_reason (tid, rea):
     elif rea == "dead":
         fmt = "\033[38;5;{}m{{}}\033[0m".format(config.recv_dead)
 
+    elif rea == "stolen":
+        fmt = "\033[38;5;{}m{{}}\033[0m".format(config.recv_stolen)
+
+    elif rea == "spec":
+        fmt = "\033[38;5;{}m{{}}\033[0m".format(config.recv_spec)
+
     return fmt.format(tid)
 
 def format_reason (tid, rea, wid):
     result = color_reason(tid, rea)
 
-    if rea == "dead":
+    if rea in ( "dead", "stolen", "spec" ):
         result = "{} <- {}".format(bold(wid), result)
 
     return result
 
-def begin (worker, *, aqueue):
-    aprint(bold(worker.id), "began", aqueue=aqueue)
+def format_recv (ids, reason):
+    printed = [
+        format_reason(tid, rea, rid)
+            for tid, ( rea, rid ) in zip(ids[ : config.max_recv ], reason)
+    ]
 
-def starve (worker, amount, *, aqueue):
-    aprint(bold(worker.id), "is starving", "#{}".format(amount), aqueue=aqueue)
+    result = ", ".join(printed) + " "
 
-def fetch (worker, ids, reason, *, aqueue):
+    if len(ids) > len(printed):
+        result += "... +{} tasks".format(len(ids) - len(printed))
+
+    return result
+
+def format_busy (busy, amount):
     printed = []
 
-    aprint(bold(worker.id), "recv", aqueue=aqueue, end=" ")
+    for wid, bid, count in busy:
+        txt = "{} <- {}".format(bold(wid), bid)
 
-    for tid, ( rea, rid ) in zip(ids, reason):
-        printed.append(format_reason(tid, rea, rid))
+        if count > 1:
+            txt += " (+{})".format(count - 1)
 
-        if len(printed) >= config.max_recv:
-            break
+        printed.append(txt)
 
-    aprint(*printed, ts=False, sep=", ", aqueue=aqueue, end=" ")
+    result = ", ".join(printed) + " "
 
-    if len(ids) > len(printed):
-        diff = "... +{}".format(len(ids) - len(printed))
-        aprint(diff, "tasks", ts=False, aqueue=aqueue, end="")
+    if amount > len(printed):
+        result += "... +{} ".format(amount - len(printed))
 
-    aprint(ts=False, aqueue=aqueue)
+    return result + "busy"
 
-def task (worker, data, pos, rea, *, aqueue):
-    beau = beautify(data)
-    data = cl.OrderedDict(data)
+def render (event):
+    kind, wid, when, *rest = event
+    head = "[{}] {}".format(get_ts(when), bold(wid))
 
-    aprint(bold(worker.id), "task", pos, "=>", beau, aqueue=aqueue)
+    if kind == "begin":
+        return "{} began\n".format(head)
 
-    start = time.time()
-    config.run(worker.id, data, pos)
-    runtime = "({})".format(get_rt(time.time() - start))
+    if kind == "end":
+        return "{} end\n".format(head)
 
-    aprint(bold(worker.id), "done", pos, "=>", beau, runtime, aqueue=aqueue)
+    if kind == "starve":
+        return "{} is starving #{}\n".format(head, rest[0])
 
-def wait (worker, busy, *, aqueue):
-    printed = []
-    unique = set()
+    if kind == "recv":
+        return "{} recv {}\n".format(head, format_recv(*rest))
+
+    if kind == "task":
+        pos, data = rest
+        return "{} task {} => {}\n".format(head, pos, beautify(data))
+
+    if kind == "done":
+        pos, data, start = rest
+        runtime = "({})".format(get_rt(when - start))
+
+        return "{} done {} => {} {}\n".format(
+            head, pos, beautify(data), runtime
+        )
+
+    if kind == "wait":
+        return "{} wait {}s: found {}\n".format(
+            head, config.time_wait, format_busy(*rest)
+        )
+
+    raise Exception("Unknown log event `{}`.".format(kind))
+
+def begin (worker, *, aqueue):
+    emit("begin", worker, aqueue=aqueue)
+
+def starve (worker, amount, *, aqueue):
+    emit("starve", worker, amount, aqueue=aqueue)
+
+def fetch (worker, ids, reason, *, aqueue):
+    emit("recv", worker, list(ids), list(reason), aqueue=aqueue)
+
+def task_begin (worker, data, pos, *, aqueue):
+    emit("task", worker, pos, data, aqueue=aqueue)
+
+    return time.time()
 
-    aprint(bold(worker.id), "wait", "{}s:".format(config.time_wait),
-           "found", aqueue=aqueue, end=" ")
+def task_end (worker, data, pos, start, *, aqueue):
+    emit("done", worker, pos, data, start, aqueue=aqueue)
 
-    for bid, wid in busy:
-        if not config.unique_busy or wid not in unique:
-            printed.append("{} <- {}".format(bold(wid), bid))
-            unique.add(wid)
+def task (worker, data, pos, rea, *, aqueue):
+    start = task_begin(worker, data, pos, aqueue=aqueue)
+    config.run(worker.id, cl.OrderedDict(data), pos)
+    task_end(worker, data, pos, start, aqueue=aqueue)
+
+async def task_async (worker, data, pos, rea, *, aqueue):
+    start = task_begin(worker, data, pos, aqueue=aqueue)
+    args = cl.OrderedDict(data)
 
-            if len(printed) >= config.max_busy:
-                break
+    if asyncio.iscoroutinefunction(config.run):
+        await config.run(worker.id, args, pos)
+    else:
+        await asyncio.get_running_loop().run_in_executor(
+            None, config.run, worker.id, args, pos
+        )
 
-    aprint(*printed, ts=False, aqueue=aqueue, end=" ", sep=", ")
+    task_end(worker, data, pos, start, aqueue=aqueue)
 
-    if len(busy) > len(printed):
-        diff = "... +{}".format(len(busy) - len(printed))
-        aprint(diff, ts=False, aqueue=aqueue, end=" ")
+def report_wait (worker, busy, *, aqueue):
+    shown = [
+        ( wid, bid, count )
+            for wid, ( bid, count ) in it.islice(busy.items(), config.max_busy)
+    ]
 
-    aprint("busy", ts=False, aqueue=aqueue)
-    time.sleep(config.time_wait)
+    emit("wait", worker, shown, len(busy), aqueue=aqueue)
+
+def wait (worker, busy, *, aqueue):
+    report_wait(worker, busy, aqueue=aqueue)
+    worker.sleep(config.time_wait)
+
+async def wait_async (worker, busy, *, aqueue):
+    report_wait(worker, busy, aqueue=aqueue)
+
+    await asyncio.get_running_loop().run_in_executor(
+        None, worker.sleep, config.time_wait
+    )
 
 def end (worker, *, aqueue):
-    aprint(bold(worker.id), "end", aqueue=aqueue)
+    emit("end", worker, aqueue=aqueue)
+
+argparser = argparse.ArgumentParser(prog=os.path.basename(__file__))
+argparser.add_argument("-concurrency", type=int, default=None)
+argparser.add_argument("-asyncio", action="store_true")
+argparser.add_argument("-speculate", action="store_true")
+argparser.add_argument("-adaptive", action="store_true")
+argparser.add_argument(
+    "-pool", choices=[ "thread", "process" ], default=config.pool
+)
+argparser.add_argument(
+    "-log-sync", choices=[ "batch", "group", "none" ], default=config.log_sync
+)
+argparser.add_argument("-log-segments", action="store_true")
+argparser.add_argument("-log-journal", action="store_true")
 
 def main (argv):
-    aqueue = queue.Queue()
+    args = argparser.parse_args(argv)
+    manager = None
+
+    if args.concurrency is None:
+        args.concurrency = (
+            config.concurrency_async if args.asyncio else config.concurrency
+        )
+
+    if args.pool == "process" and args.concurrency > 1 and not args.asyncio:
+        manager = mp.Manager()
+        aqueue = manager.Queue()
+    else:
+        aqueue = queue.Queue()
+
+    events = None
+
+    if args.log_journal or config.log_journal:
+        events = config.files.journal
 
     logger = threading.Thread(target=async_printer, kwargs={
-        "fname": config.files.log, "aqueue": aqueue
+        "fname": config.files.log, "aqueue": aqueue, "sync": args.log_sync,
+        "segment": args.log_segments or config.log_segments,
+        "events": events
     })
 
     logger.start()
     wrk = worker.worker()
+    equeue = aqueue
+
+    if config.files.log == os.devnull and events is None:
+        equeue = None
+
+    kwargs = {
+        "num_tasks": config.num_tasks, "concurrency": args.concurrency,
+        "speculate": args.speculate or config.speculate,
+        "adaptive": args.adaptive or config.adaptive,
+        "begin": begin, "starve": starve, "fetch": fetch, "end": end,
+        "tkwargs": { "aqueue": equeue }, "bkwargs": { "aqueue": equeue },
+        "skwargs": { "aqueue": equeue }, "fkwargs": { "aqueue": equeue },
+        "wkwargs": { "aqueue": equeue }, "ekwargs": { "aqueue": equeue }
+    }
 
     try:
-        wrk.work(task, num_tasks=config.num_tasks,
-                 begin=begin, starve=starve,
-                 fetch=fetch, wait=wait, end=end,
-                 tkwargs={ "aqueue": aqueue },
-                 bkwargs={ "aqueue": aqueue },
-                 skwargs={ "aqueue": aqueue },
-                 fkwargs={ "aqueue": aqueue },
-                 wkwargs={ "aqueue": aqueue },
-                 ekwargs={ "aqueue": aqueue })
+        if args.asyncio:
+            asyncio.run(wrk.work_async(task_async, wait=wait_async, **kwargs))
+        else:
+            wrk.work(task, wait=wait, pool=args.pool, **kwargs)
 
     except KeyboardInterrupt:
         pass
@@ -195,5 +359,8 @@ def main (argv):
     aqueue.put(None)
     logger.join()
 
+    if manager is not None:
+        manager.shutdown()
+
 if __name__ == "__main__":
     main(sys.argv[ 1 : ])
@@ -2,16 +2,28 @@
 
 import os
 import sys
+import math
 import util
+import bisect
+import pickle
 import struct
-import random
 import argparse
+import functools
+import contextlib
 import itertools as it
 import collections as cl
+import concurrent.futures as futures
 
+import logs
 import flock
 import alist
 import config
+import keyset
+import notify
+import shards
+import scan
+import summary
+import table
 
 
 def iter_keys (defaults, tests):
@@ -40,24 +52,228 @@ def iter_values (defaults, tests):
                 if val not in unique[key]:
                     yield key, val
 
-def iter_tests (defaults, tests, order):
+def iter_combos (tests, indices=None):
+    if indices is None:
+        for test in tests:
+            keys = [ key for key, _ in test ]
+
+            for vals in it.product(*( opts for _, opts in test )):
+                yield keys, vals
+
+        return
+
+    sizes = list(it.accumulate(
+        math.prod(len(opts) for _, opts in test) for test in tests
+    ))
+
+    for index in indices:
+        group = bisect.bisect_right(sizes, index)
+        test = tests[group]
+        index -= sizes[group - 1] if group else 0
+        vals = []
+
+        for _, opts in reversed(test):
+            index, digit = divmod(index, len(opts))
+            vals.append(opts[digit])
+
+        yield [ key for key, _ in test ], vals[ : : -1 ]
+
+def iter_tests (defaults, tests, order, indices=None):
     sort_key = lambda x: order[x[0]]
 
+    for keys, vals in iter_combos(tests, indices):
+        flags = { **defaults, **dict(zip(keys, vals)) }
+        flags = cl.OrderedDict(sorted(flags.items(), key=sort_key))
+
+        for exp in config.expand(flags):
+            yield tuple(exp.items())
+
+def expand_block (defaults, tests, order, indices):
+    return list(iter_tests(defaults, tests, order, indices))
+
+def index_blocks (indices, total, size):
+    if indices is not None:
+        yield from chunked(indices, size)
+        return
+
+    for start in range(0, total, size):
+        yield range(start, min(start + size, total))
+
+def iter_parallel (defaults, tests, order, indices, jobs, size):
+    expand = functools.partial(expand_block, defaults, tests, order)
+    blocks = index_blocks(indices, grid_size(tests), size)
+    pending = cl.deque()
+
+    with futures.ProcessPoolExecutor(jobs) as pool:
+        for block in blocks:
+            pending.append(pool.submit(expand, block))
+
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+def canonical (task):
+    return tuple(sorted(task))
+
+def unique (tests, keys, recent):
+    for test in tests:
+        value = keyset.key_hash(canonical(test))
+
+        if value not in keys and value not in recent:
+            recent.add(value)
+            yield test
+
+def same (val, opt):
+    return type(val) is type(opt) and val == opt
+
+def has (opts, val):
+    return any(same(val, opt) for opt in opts)
+
+def grid_delta (test, grid):
+    result = []
+
+    for i, ( key, opts ) in enumerate(test):
+        new = [ val for val in opts if not has(grid[i], val) ]
+
+        if new:
+            result.append([
+                *(
+                    ( prev, [ val for val in vals if has(grid[j], val) ] )
+                        for j, ( prev, vals ) in enumerate(test[ : i ])
+                ),
+                ( key, new ),
+                *test[ i + 1 : ]
+            ])
+
+    return result
+
+def pending_tests (tests, grids):
+    result = []
+
+    for test in tests:
+        keys = tuple(key for key, _ in test)
+        parts = [ list(test) ]
+
+        for grid_keys, grid in grids:
+            if grid_keys == keys:
+                parts = [
+                    delta for part in parts
+                        for delta in grid_delta(part, grid)
+                ]
+
+        result.extend(parts)
+
+    return result
+
+def merge_grids (grids, tests):
+    result = list(grids)
+
     for test in tests:
-        keys = [ key for key, _ in test ]
-        opts = [ opt for _, opt in test ]
+        keys = tuple(key for key, _ in test)
+        grid = [ list(opts) for _, opts in test ]
+
+        result = [
+            ( grid_keys, old ) for grid_keys, old in result
+                if grid_keys != keys or not all(
+                    all(has(new, val) for val in vals)
+                        for vals, new in zip(old, grid)
+                )
+        ]
+
+        result.append(( keys, grid ))
+
+    return result
+
+def load_grids (fingerprint):
+    try:
+        with open(config.files.grids, "rb") as file:
+            saved, grids = pickle.load(file)
+
+    except (FileNotFoundError, EOFError):
+        return []
+
+    return grids if saved == fingerprint else []
+
+def save_grids (fingerprint, grids):
+    temp = config.files.grids + ".tmp"
+
+    with open(temp, "wb") as file:
+        pickle.dump(( fingerprint, grids ), file)
+        alist.commit(file)
+
+    os.replace(temp, config.files.grids)
+
+def grid_size (tests):
+    return sum(math.prod(len(opts) for _, opts in test) for test in tests)
+
+def chunked (iterator, size):
+    chunk = []
+    empty = True
+
+    for value in iterator:
+        chunk.append(value)
+
+        if size is not None and len(chunk) >= size:
+            yield chunk
+            chunk = []
+            empty = False
+
+    if chunk or empty:
+        yield chunk
 
-        for vals in it.product(*opts):
-            flags = { **defaults, **dict(zip(keys, vals)) }
-            flags = cl.OrderedDict(sorted(flags.items(), key=sort_key))
+@contextlib.contextmanager
+def locked (dones, queue):
+    with contextlib.ExitStack() as stack:
+        for done in dones:
+            stack.enter_context(flock.flock(done))
 
-            for exp in config.expand(flags):
-                yield tuple(exp.items())
+        stack.enter_context(flock.flock(queue))
+
+        yield
+
+def publish (dones, shard_files, total, rebuild, release):
+    num_shards = len(shard_files)
+
+    for shard, ( done, ( _, summary_path ) ) in \
+            enumerate(zip(dones, shard_files)):
+
+        done.seek(0, os.SEEK_END)
+
+        if not done.tell():
+            util.write_head(done)
+
+        fsize = util.slot_count(done.tell())
+
+        for _ in range(shards.size(shard, total, num_shards) - fsize):
+            done.write(config.slot.sep_free)
+
+        done.flush()
+        done.seek(0, os.SEEK_SET)
+
+        with util.mapped(done) as mem, \
+             summary.summary(summary_path) as summ:
+
+            if release:
+                scan.release(mem, 0, util.slot_count(len(mem)))
+
+            summ.sync(mem, rebuild=rebuild)
 
 argparser = argparse.ArgumentParser(prog=os.path.basename(__file__))
 argparser.add_argument("-clear", action="store_true")
 argparser.add_argument("-shuffle", action="store_true")
 argparser.add_argument("-release-tasks", action="store_true")
+argparser.add_argument("-stream", action="store_true")
+argparser.add_argument("-chunk", type=int, default=config.gen_chunk)
+argparser.add_argument("-seed", type=int, default=config.gen_seed)
+argparser.add_argument("-full", action="store_true")
+argparser.add_argument("-jobs", type=int, default=config.gen_jobs)
+argparser.add_argument(
+    "-queue-format", choices=[ "pickle", "table" ], default=config.queue_format
+)
+argparser.add_argument("-shards", type=int, default=None)
+argparser.add_argument("-id-bytes", type=int, choices=[ 2, 4, 8 ])
 argparser.add_argument("-no-warnings", action="store_false", dest="warnings")
 
 def main (argv):
@@ -71,7 +287,7 @@ def main (argv):
             continue
 
         pos = len(order)
-        defaults[key] = DISABLE
+        defaults[key] = config.DISABLE
         order[key] = pos
 
         if args.warnings:
@@ -84,7 +300,7 @@ def main (argv):
     os.makedirs(config.paths.task, exist_ok=True)
     os.makedirs(config.paths.lock, exist_ok=True)
 
-    alist.mkfile(config.files.wid, config.files.done,
+    alist.mkfile(config.files.wid,
                  config.files.data, config.files.log,
                  config.files.progress, config.files.translate)
 
@@ -100,49 +316,134 @@ def main (argv):
 
     o_type = "w{}+" if args.clear else "r{}+"
 
-    with open(config.files.data, o_type.format("b")) as queue, \
-         open(config.files.done, o_type.format("b")) as done, \
-         open(config.files.translate, o_type.format("")) as tlate:
-
-        with flock.flock(queue), flock.flock(done):
-            exists = set()
-
-            for task in alist.iterate_locked(queue):
-                exists.add(tuple(sorted(task)))
+    old_shards = shards.count()
+    fresh = args.clear or os.path.getsize(config.files.data) == 0
+    num_shards = old_shards
+
+    if fresh:
+        num_shards = args.shards or config.num_shards
+
+    elif args.shards not in ( None, old_shards ):
+        argparser.error(
+            "task directory uses {} shards, use -clear to change it"
+                .format(old_shards)
+        )
+
+    if fresh:
+        width = args.id_bytes or config.use_bytes
+        config.set_layout(config.done_version, width)
+
+    elif shards.load_layout(old_shards) and \
+         args.id_bytes not in ( None, config.slot.width ):
+
+        argparser.error(
+            "task directory uses {}-byte ids, use migrate.py to change it"
+                .format(config.slot.width)
+        )
+
+    if num_shards != old_shards:
+        for done_path, summary_path in shards.files(old_shards):
+            for fname in ( done_path, summary_path,
+                           shards.start_name(done_path) ):
+                if os.path.exists(fname):
+                    os.remove(fname)
+
+        shards.save(num_shards)
+
+    if fresh:
+        for fname in ( table.dict_name(config.files.data),
+                       config.files.runtimes, config.files.breakdown,
+                       config.files.seen, config.files.journal,
+                       *logs.segment_names() ):
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    shard_files = shards.files(num_shards)
+    alist.mkfile(*( done_path for done_path, _ in shard_files ))
+
+    with contextlib.ExitStack() as stack:
+        dones = [
+            stack.enter_context(open(done_path, "wb+" if fresh else "rb+"))
+                for done_path, _ in shard_files
+        ]
+
+        queue = stack.enter_context(
+            open(config.files.data, o_type.format("b"))
+        )
+
+        tlate = stack.enter_context(
+            open(config.files.translate, o_type.format(""))
+        )
+
+        keys = stack.enter_context(
+            keyset.keyset(config.files.data, canonical)
+        )
+
+        with locked(dones, queue):
+            queue.seek(0, os.SEEK_END)
+            keys.sync_locked(queue, queue.tell())
+            count = table.count_locked(queue)
+
+        fingerprint = keyset.key_hash(tuple(defaults.items()))
+        grids = [] if fresh or args.full else load_grids(fingerprint)
+        tests = pending_tests(config.tests, grids)
+        indices = None
+
+        if args.shuffle:
+            indices = util.permutation(grid_size(tests), args.seed)
+
+        recent = set()
+
+        if args.jobs > 1:
+            tests = iter_parallel(
+                defaults, tests, order, indices, args.jobs, config.gen_block
+            )
+        else:
+            tests = iter_tests(defaults, tests, order, indices)
+
+        tests = unique(tests, keys, recent)
+
+        created = 0
+        rebuild = args.clear or args.release_tasks
+        release = not args.clear and args.release_tasks
+
+        for chunk in chunked(tests, args.chunk if args.stream else None):
+            with locked(dones, queue):
+                queue.seek(0, os.SEEK_END)
+                written = table.write_locked(
+                    queue, *chunk, keys=keys,
+                    compact=args.queue_format == "table"
+                )
 
-            tests = [
-                ts for ts in iter_tests(defaults, config.tests, order)
-                    if tuple(sorted(ts)) not in exists
-            ]
+                recent.clear()
 
-            if args.shuffle:
-                random.shuffle(tests, (lambda: 0.42))
+                tlate.seek(0, os.SEEK_END)
 
-            created = alist.write_locked(queue, *tests)
+                for ident, test in zip(it.count(count + created), chunk):
+                    print(
+                        ident, "=>", *(filter(bool,
+                            map(" ".join,
+                                util.mapstar(config.param_format, test))
+                        )),
+                        file=tlate
+                    )
 
-            tlate.seek(0, os.SEEK_END)
+                tlate.flush()
+                created += written
 
-            for ident, test in zip(it.count(len(exists)), tests):
-                print(
-                    ident, "=>", *(filter(bool,
-                        map(" ".join, util.mapstar(config.param_format, test))
-                    )),
-                    file=tlate
+                publish(
+                    dones, shard_files, count + created, rebuild, release
                 )
 
-            done.seek(0, os.SEEK_END)
-
-            for _ in range(created):
-                done.write(config.sep_free)
+            rebuild = release = False
 
-            if not args.clear and args.release_tasks:
-                done.seek(0, os.SEEK_SET)
+            if args.stream:
+                print("published", count + created, "experiments")
 
-                with mmap.mmap(done.fileno(), 0) as mem:
-                    for s, e in util.iter_work(mem):
-                        mem[ s : e ] = config.sep_free
+        print("created", created, "experiments")
 
-            print("created", created, "experiments")
+    save_grids(fingerprint, merge_grids(grids, config.tests))
+    notify.touch()
 
 if __name__ == "__main__":
     main(sys.argv[ 1 : ])
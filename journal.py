@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import struct
+import argparse
+
+import flock
+import config
+
+
+kinds = [ None, "begin", "end", "starve", "recv", "task", "done", "wait" ]
+reasons = [ None, "free", "mine", "dead", "stolen", "spec" ]
+
+kind_codes = { kind : code for code, kind in enumerate(kinds) if kind }
+reason_codes = { rea : code for code, rea in enumerate(reasons) if rea }
+
+record_size = struct.calcsize(config.journal_format)
+
+def pack (kind, when, wid, pos=0, reason=None, other=0, runtime=0.0):
+    return struct.pack(
+        config.journal_format, kind_codes[kind],
+        reason_codes.get(reason, 0), when, wid, pos, other, runtime
+    )
+
+def encode (event):
+    kind, wid, when, *rest = event
+
+    if kind in ( "begin", "end" ):
+        return pack(kind, when, wid)
+
+    if kind == "starve":
+        return pack(kind, when, wid, rest[0])
+
+    if kind == "recv":
+        ids, reason = rest
+
+        return b"".join(
+            pack(kind, when, wid, tid, rea, rid or 0)
+                for tid, ( rea, rid ) in zip(ids, reason)
+        )
+
+    if kind == "task":
+        return pack(kind, when, wid, rest[0])
+
+    if kind == "done":
+        pos, _, start = rest
+        return pack(kind, when, wid, pos, runtime=when - start)
+
+    if kind == "wait":
+        return pack(kind, when, wid, rest[1])
+
+    raise Exception("Unknown log event `{}`.".format(kind))
+
+def read (fname, shared=True):
+    with open(fname, "rb") as file:
+        with flock.flock(file, shared=shared):
+            data = file.read()
+
+    data = data[ : len(data) - len(data) % record_size ]
+
+    for kind, reason, when, wid, pos, other, runtime in \
+            struct.iter_unpack(config.journal_format, data):
+
+        yield kinds[kind], reasons[reason], when, wid, pos, other, runtime
+
+argparser = argparse.ArgumentParser(
+    prog=os.path.basename(__file__),
+    description="Print the binary event journal as tab separated values."
+)
+
+argparser.add_argument("fname", nargs="?", default=None)
+
+def main (argv):
+    args = argparser.parse_args(argv)
+
+    for record in read(args.fname or config.files.journal):
+        print(*( "-" if value is None else value for value in record ),
+              sep="\t")
+
+if __name__ == "__main__":
+    main(sys.argv[ 1 : ])
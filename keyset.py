@@ -0,0 +1,164 @@
+import os
+import mmap
+import array
+import pickle
+import struct
+import hashlib
+
+import table
+
+head_format = "<QQQ"
+head_size = struct.calcsize(head_format)
+
+slot_format = "<Q"
+slot_size = struct.calcsize(slot_format)
+
+min_capacity = 1024
+
+def keys_name (fname):
+    return fname + ".keys"
+
+def key_hash (key):
+    data = pickle.dumps(key, protocol=4)
+    digest = hashlib.blake2b(data, digest_size=slot_size).digest()
+
+    return int.from_bytes(digest, "little") or 1
+
+class keyset (object):
+
+    __slots__ = [ "file", "mem", "key" ]
+
+    def __init__ (self, fname, key):
+        name = keys_name(fname)
+
+        if not os.path.exists(name):
+            open(name, "a").close()
+
+        self.file = open(name, "rb+")
+        self.mem = None
+        self.key = key
+
+        self.map()
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, *_):
+        self.close()
+
+    def map (self):
+        size = os.fstat(self.file.fileno()).st_size
+
+        if self.mem is not None and len(self.mem) == size:
+            return
+
+        self.unmap()
+
+        if size >= head_size + min_capacity * slot_size:
+            self.mem = mmap.mmap(self.file.fileno(), size)
+
+    def unmap (self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+    def close (self):
+        self.unmap()
+        self.file.close()
+
+    def head (self):
+        if self.mem is None:
+            return 0, 0, 0
+
+        return struct.unpack_from(head_format, self.mem, 0)
+
+    def set_head (self, covered, count, capacity):
+        struct.pack_into(head_format, self.mem, 0, covered, count, capacity)
+
+    def reset (self, capacity=min_capacity):
+        self.unmap()
+
+        os.ftruncate(self.file.fileno(), 0)
+        os.ftruncate(self.file.fileno(), head_size + capacity * slot_size)
+
+        self.map()
+        self.set_head(0, 0, capacity)
+
+    def probe (self, value):
+        capacity = self.head()[2]
+        index = value % capacity
+
+        while True:
+            offset = head_size + index * slot_size
+            found = struct.unpack_from(slot_format, self.mem, offset)[0]
+
+            if found in ( 0, value ):
+                return offset, found
+
+            index = (index + 1) % capacity
+
+    def __contains__ (self, value):
+        if self.mem is None:
+            return False
+
+        return self.probe(value)[1] == value
+
+    def __len__ (self):
+        return self.head()[1]
+
+    def values (self):
+        capacity = self.head()[2]
+        end = head_size + capacity * slot_size
+
+        for offset in range(head_size, end, slot_size):
+            value = struct.unpack_from(slot_format, self.mem, offset)[0]
+
+            if value:
+                yield value
+
+    def add (self, value):
+        offset, found = self.probe(value)
+
+        if found == value:
+            return False
+
+        struct.pack_into(slot_format, self.mem, offset, value)
+        covered, count, capacity = self.head()
+        self.set_head(covered, count + 1, capacity)
+
+        if 2 * (count + 1) > capacity:
+            self.grow(2 * capacity)
+
+        return True
+
+    def grow (self, capacity):
+        covered = self.head()[0]
+        values = array.array("Q", self.values())
+
+        self.reset(capacity)
+
+        for value in values:
+            self.add(value)
+
+        self.set_head(covered, len(values), capacity)
+
+    def extend (self, data, end):
+        for value in data:
+            self.add(key_hash(self.key(value)))
+
+        covered, count, capacity = self.head()
+        self.set_head(end, count, capacity)
+
+    def sync_locked (self, file, end):
+        covered = self.head()[0]
+
+        if self.mem is None or covered > end:
+            self.reset()
+            covered = 0
+
+        if covered < end:
+            self.extend(table.records_locked(file, covered, end), end)
+
+    def flush (self):
+        if self.mem is not None:
+            self.mem.flush()
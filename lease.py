@@ -0,0 +1,117 @@
+import os
+import mmap
+import time
+import queue
+import struct
+import threading
+
+import alist
+import flock
+import config
+import starvation
+
+
+lease_size = struct.calcsize(config.lease_format)
+
+class table (object):
+
+    __slots__ = [ "file", "mem" ]
+
+    def __init__ (self, fname):
+        alist.mkfile(fname)
+        self.file = open(fname, "rb+")
+        self.mem = None
+
+    def map (self, wid=None):
+        size = os.fstat(self.file.fileno()).st_size
+
+        if wid is not None and size < (wid + 1) * lease_size:
+            with flock.flock(self.file):
+                size = os.fstat(self.file.fileno()).st_size
+
+                if size < (wid + 1) * lease_size:
+                    size = (wid + 1) * lease_size
+                    os.ftruncate(self.file.fileno(), size)
+
+        if self.mem is None or len(self.mem) != size:
+            self.unmap()
+
+            if size:
+                self.mem = mmap.mmap(self.file.fileno(), size)
+
+    def unmap (self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+    def close (self):
+        self.unmap()
+        self.file.close()
+
+    def stamp (self, wid, when):
+        self.map(wid)
+        struct.pack_into(config.lease_format, self.mem, wid * lease_size, when)
+
+    def read (self, wid):
+        if self.mem is None or len(self.mem) < (wid + 1) * lease_size:
+            self.map()
+
+        if self.mem is None or len(self.mem) < (wid + 1) * lease_size:
+            return 0.0
+
+        return struct.unpack_from(
+            config.lease_format, self.mem, wid * lease_size
+        )[0]
+
+    def alive (self, wid, now):
+        return now - self.read(wid) < config.time_lease
+
+def beat_thread (wait, aqueue, func):
+    while True:
+        try:
+            value = aqueue.get(timeout=wait)
+        except queue.Empty:
+            func()
+            continue
+
+        if value is starvation.command.END:
+            break
+
+class heartbeat (object):
+
+    __slots__ = [ "wid", "leases", "thread", "aqueue", "last_touch" ]
+
+    def __init__ (self, wid):
+        self.wid = wid
+        self.leases = table(config.files.leases)
+        self.aqueue = queue.Queue()
+        self.last_touch = time.monotonic()
+
+        self.thread = threading.Thread(target=beat_thread, kwargs={
+            "wait": config.time_beat, "aqueue": self.aqueue, "func": self.beat
+        })
+
+    def touch (self):
+        self.last_touch = time.monotonic()
+
+    def beat (self):
+        hung = time.monotonic() - self.last_touch
+
+        if not config.time_hung or hung < config.time_hung:
+            self.leases.stamp(self.wid, time.time())
+
+    def end (self):
+        self.aqueue.put(starvation.command.END)
+        self.thread.join()
+
+        self.leases.stamp(self.wid, 0.0)
+        self.leases.close()
+
+    def __enter__ (self):
+        self.leases.stamp(self.wid, time.time())
+        self.thread.start()
+
+        return self
+
+    def __exit__ (self, *_):
+        self.end()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import heapq
+import socket
+import argparse
+import datetime
+import itertools as it
+import collections as cl
+
+import config
+
+
+tail_block = 64 * 1024
+
+def segment_name (host=None, pid=None):
+    host = socket.gethostname() if host is None else host
+    pid = os.getpid() if pid is None else pid
+
+    return os.path.join(config.paths.logs, "{}-{}.out".format(host, pid))
+
+def segment_names ():
+    return sorted(glob.glob(os.path.join(config.paths.logs, "*.out")))
+
+def stamp_lines (text, fresh, now):
+    result = []
+
+    for line in text.splitlines(keepends=True):
+        if fresh:
+            result.append("{:.6f}\t".format(now))
+
+        result.append(line)
+        fresh = line.endswith("\n")
+
+    return "".join(result), fresh
+
+def last_lines (fname, amount):
+    with open(fname, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        data = b""
+
+        while end and data.count(b"\n") <= amount + 1:
+            start = max(0, end - tail_block)
+            file.seek(start, os.SEEK_SET)
+            data = file.read(end - start) + data
+            end = start
+
+    lines = data.decode(errors="replace").splitlines(keepends=True)
+
+    return lines[ -amount - 1 : ]
+
+def line_time (line, anchor):
+    head, sep, _ = line.partition("]")
+
+    if not sep or not head.startswith("["):
+        return None
+
+    try:
+        found = datetime.datetime.strptime(head[ 1 : ], config.ts_format)
+    except ValueError:
+        return None
+
+    if found.year == 1900:
+        found = datetime.datetime.combine(
+            datetime.datetime.fromtimestamp(anchor).date(), found.time()
+        )
+
+    when = found.timestamp()
+
+    if when - anchor > 43200:
+        when -= 86400
+
+    return min(when, anchor)
+
+def anchored (lines, mtime):
+    lines = list(it.takewhile(lambda line: line.endswith("\n"), lines))
+    result = []
+    key = mtime
+
+    for line in reversed(lines):
+        when = line_time(line, key)
+
+        if when is not None:
+            key = when
+
+        result.append(( key, line ))
+
+    return result[ : : -1 ]
+
+def parse (lines, stamped, mtime=None):
+    if not stamped:
+        yield from anchored(lines, mtime)
+        return
+
+    for line in lines:
+        if not line.endswith("\n"):
+            break
+
+        stamp, _, text = line.partition("\t")
+
+        try:
+            yield float(stamp), text
+        except ValueError:
+            continue
+
+def sources (amount=None):
+    fnames = [ ( config.files.log, False ) ]
+    fnames.extend(( fname, True ) for fname in segment_names())
+
+    for fname, stamped in fnames:
+        if not os.path.exists(fname):
+            continue
+
+        mtime = os.path.getmtime(fname)
+
+        if amount is None:
+            with open(fname, errors="replace") as file:
+                yield list(parse(file, stamped, mtime))
+        else:
+            yield list(parse(last_lines(fname, amount), stamped, mtime))
+
+def read ():
+    for _, line in heapq.merge(*sources(), key=lambda x: x[0]):
+        yield line
+
+def tail (amount):
+    lines = cl.deque(maxlen=amount)
+
+    for _, line in heapq.merge(*sources(amount), key=lambda x: x[0]):
+        lines.append(line)
+
+    return "".join(lines)
+
+argparser = argparse.ArgumentParser(
+    prog=os.path.basename(__file__),
+    description="Print the task log merged with the per-worker segments."
+)
+
+argparser.add_argument("-n", type=int, default=None)
+
+def main (argv):
+    args = argparser.parse_args(argv)
+
+    if args.n is None:
+        sys.stdout.writelines(read())
+    else:
+        sys.stdout.write(tail(args.n))
+
+if __name__ == "__main__":
+    main(sys.argv[ 1 : ])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import contextlib
+
+import util
+import alist
+import flock
+import config
+import shards
+import summary
+
+
+def convert (data, head, width, new_width):
+    size = len(config.sep_byte) + width
+    done = config.done_byte * width
+    limit = (1 << (8 * new_width)) - 1
+    result = bytearray(util.pack_head(new_width))
+
+    for offset in range(head, len(data) - size + 1, size):
+        ident = data[ offset + len(config.sep_byte) : offset + size ]
+
+        if ident == done:
+            ident = config.done_byte * new_width
+
+        else:
+            value = int.from_bytes(ident, config.use_order)
+
+            if value >= limit:
+                raise Exception("Worker id `{}` does not fit in {} bytes."
+                                .format(value, new_width))
+
+            ident = value.to_bytes(new_width, config.use_order)
+
+        result += config.sep_byte + ident
+
+    return result
+
+argparser = argparse.ArgumentParser(
+    prog=os.path.basename(__file__),
+    description="Rewrite the done files of a task directory to another "
+                "worker id width. Stop every worker before running it."
+)
+
+argparser.add_argument("-id-bytes", type=int, choices=[ 2, 4, 8 ],
+                       default=config.use_bytes)
+
+def main (argv):
+    args = argparser.parse_args(argv)
+    limit = (1 << (8 * args.id_bytes)) - 1
+    shard_files = shards.files(shards.count())
+
+    alist.mkfile(config.files.wid)
+
+    with contextlib.ExitStack() as stack:
+        wid = stack.enter_context(open(config.files.wid, "rb+"))
+        stack.enter_context(flock.flock(wid))
+
+        last_id = int.from_bytes(wid.read(config.wid_bytes), config.use_order)
+
+        if last_id + 1 >= limit:
+            raise Exception("Worker id `{}` does not fit in {} bytes."
+                            .format(last_id + 1, args.id_bytes))
+
+        dones = []
+
+        for done_path, _ in shard_files:
+            alist.mkfile(done_path)
+            done = stack.enter_context(open(done_path, "rb+"))
+            stack.enter_context(flock.flock(done))
+            dones.append(done)
+
+        for done in dones:
+            head = util.read_head(done) or ( 0, 2 )
+            version, width = head
+            config.set_layout(version, width)
+
+            done.seek(0, os.SEEK_SET)
+            data = convert(done.read(), config.slot.head, width, args.id_bytes)
+
+            temp = done.name + ".migrate"
+
+            with open(temp, "wb") as file:
+                file.write(data)
+                alist.commit(file)
+
+            os.replace(temp, done.name)
+
+        config.set_layout(config.done_version, args.id_bytes)
+
+        for done_path, summary_path in shard_files:
+            with open(done_path, "rb+") as done, \
+                 util.mapped(done) as mem, \
+                 summary.summary(summary_path) as summ:
+
+                summ.sync(mem, rebuild=True)
+
+    print("migrated", len(shard_files), "shards to", args.id_bytes, "byte ids")
+
+if __name__ == "__main__":
+    main(sys.argv[ 1 : ])
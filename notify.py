@@ -0,0 +1,160 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+import alist
+import config
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+file_mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+event_format = "iIII"
+event_size = struct.calcsize(event_format)
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.inotify_init1
+    libc.inotify_add_watch
+
+except (OSError, AttributeError):
+    libc = None
+
+def touch ():
+    alist.mkfile(config.files.events)
+    os.utime(config.files.events)
+
+class poller (object):
+
+    __slots__ = [ "fnames", "last" ]
+
+    def __init__ (self, fnames, dirs=()):
+        self.fnames = list(fnames)
+        self.last = None
+
+    def snapshot (self):
+        return [ alist.stamp(fname) for fname in self.fnames ]
+
+    def clear (self):
+        self.last = self.snapshot()
+
+    def wait (self, timeout):
+        end = time.monotonic() + timeout
+
+        if self.last is None:
+            self.clear()
+
+        while True:
+            if self.snapshot() != self.last:
+                self.clear()
+                return True
+
+            left = end - time.monotonic()
+
+            if left <= 0:
+                return False
+
+            time.sleep(min(config.time_poll, left))
+
+    def close (self):
+        pass
+
+class inotify (object):
+
+    __slots__ = [ "fd", "names" ]
+
+    def __init__ (self, fnames, dirs=()):
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        self.names = {}
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        try:
+            watched = {}
+
+            for fname in fnames:
+                path, name = os.path.split(os.path.realpath(fname))
+                watched.setdefault(path, set()).add(os.fsencode(name))
+
+            for path, names in watched.items():
+                self.add(path, file_mask, names)
+
+            for path in dirs:
+                self.add(os.path.realpath(path), IN_CLOSE_WRITE, None)
+
+        except OSError:
+            self.close()
+            raise
+
+    def add (self, path, mask, names):
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", path)
+
+        self.names[wd] = names
+
+    def read (self):
+        found = False
+
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as exc:
+                if exc.errno in ( errno.EAGAIN, errno.EWOULDBLOCK ):
+                    return found
+
+                raise
+
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, _, size = struct.unpack_from(
+                    event_format, data, offset
+                )
+
+                offset += event_size
+                name = data[ offset : offset + size ].rstrip(b"\x00")
+                offset += size
+                names = self.names.get(wd)
+
+                if names is None or name in names:
+                    found = True
+
+    def clear (self):
+        self.read()
+
+    def wait (self, timeout):
+        end = time.monotonic() + timeout
+
+        while True:
+            left = end - time.monotonic()
+
+            if left <= 0:
+                return False
+
+            if select.select([ self.fd ], [], [], left)[0] and self.read():
+                return True
+
+    def close (self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def watcher (fnames, dirs=()):
+    if config.wakeup == "inotify" and libc is not None:
+        try:
+            return inotify(fnames, dirs)
+        except OSError:
+            pass
+
+    return poller(fnames, dirs)
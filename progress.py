@@ -6,11 +6,20 @@ import mmap
 import time
 import struct
 import argparse
+import statistics
 
+import scan
 import util
 import alist
 import flock
 import config
+import shards
+import summary
+import breakdown
+
+
+head_size = struct.calcsize(config.pro_format)
+sample_size = struct.calcsize(config.pro_sample)
 
 
 def sec_to_str (sec):
@@ -31,79 +40,233 @@ def sec_to_str (sec):
 
     return result
 
+def file_size (fname):
+    return os.path.getsize(fname) if os.path.exists(fname) else 0
+
+def read_counts (shard_files):
+    count = 0
+    total = 0
+
+    for done_path, summary_path in shard_files:
+        totals = summary.read_totals(summary_path)
+
+        if totals is None and file_size(done_path):
+            with open(done_path, "rb") as done, \
+                 util.mapped(done, mmap.ACCESS_READ) as mem:
+
+                covered = util.slot_count(len(mem))
+                counts = scan.counts(mem, 0, covered)
+
+        elif totals is None:
+            covered, counts = 0, [ 0, 0, 0 ]
+
+        else:
+            covered, counts = totals
+
+        count += counts[summary.DONE]
+        total += covered
+
+    return count, total
+
+def read_history (file):
+    file.seek(0, os.SEEK_SET)
+    data = file.read(head_size + config.pro_history * sample_size)
+    head = data[ : head_size ].ljust(head_size, b"\x00")
+    head = list(struct.unpack(config.pro_format, head))
+    written = head[5]
+    samples = []
+
+    for index in range(max(0, written - config.pro_history), written):
+        offset = head_size + (index % config.pro_history) * sample_size
+
+        if offset + sample_size <= len(data):
+            samples.append(struct.unpack_from(config.pro_sample, data, offset))
+
+    return head, samples
+
+def record (file, count, total, now):
+    head, samples = read_history(file)
+    _, _, start_size, start_time, rate, written = head
+
+    if not start_time or samples and count < samples[-1][1]:
+        start_size, start_time, rate, written = count, now, 0.0, 0
+        samples = []
+
+    if samples:
+        last_time, last_count = samples[-1]
+        span = now - last_time
+
+        if span < config.time_sample:
+            return head, samples
+
+        current = (count - last_count) / span
+        weight = 1 - 0.5 ** (span / config.rate_halflife)
+        rate = current if written == 1 else rate + weight * (current - rate)
+
+    offset = head_size + (written % config.pro_history) * sample_size
+    file.seek(offset, os.SEEK_SET)
+    file.write(struct.pack(config.pro_sample, now, count))
+
+    head = [ count, total, start_size, start_time, rate, written + 1 ]
+    file.seek(0, os.SEEK_SET)
+    file.write(struct.pack(config.pro_format, *head))
+    alist.commit(file)
+
+    samples.append(( now, count ))
+
+    return head, samples[ -config.pro_history : ]
+
+def window_rate (samples):
+    if len(samples) < 2:
+        return 0
+
+    ( first_time, first_count ), ( last_time, last_count ) = \
+        samples[0], samples[-1]
+
+    return (last_count - first_count) / (last_time - first_time)
+
+def report_line (count, total, head, now):
+    _, _, start_size, start_time, rate, _ = head
+    perc = 100 * count / total if total else 100.0
+    out = "{} / {} = {:.2f}% ".format(count, total, perc)
+
+    if count == total:
+        return out + "\033[1mdone\033[0m"
+
+    if not rate and now > start_time > 0:
+        rate = (count - start_size) / (now - start_time)
+
+    eta = sec_to_str((total - count) / rate) if rate > 0 else "-"
+
+    return out + "({:.2f} / s) ETA: {}".format(rate, eta)
+
+def estimate (state, samples, now):
+    every = state.runtime_stats
+
+    if not every[3]:
+        return "no task runtimes recorded yet"
+
+    mean, var = breakdown.moments(every)
+    since = max(now - config.rate_window, state.first)
+    oldest = breakdown.recent_bucket(since)
+    span = max(now - since, 1e-6)
+
+    recent = [
+        ( wid, amount, runtime )
+            for ( bucket, wid ), ( amount, runtime ) in state.recent.items()
+                if bucket >= oldest
+    ]
+
+    busy = sum(runtime for _, _, runtime in recent) / span
+
+    work = {}
+    total_work = total_var = 0
+
+    for group, stats in state.group_stats.items():
+        left = stats[0] - stats[1]
+        gmean, gvar = mean, var
+
+        if stats[3] > 1:
+            gmean, gvar = breakdown.moments(stats)
+
+        work[group] = left, gmean
+        total_work += left * gmean
+        total_var += left * gvar
+
+    lines = []
+    etas = []
+
+    for q in config.eta_quantiles:
+        z = statistics.NormalDist().inv_cdf(q) if 0 < q < 1 else 0
+        eta = max(0, total_work + z * total_var ** 0.5)
+        eta = sec_to_str(eta / busy) if busy > 0 else "-"
+        etas.append("p{:g} {}".format(100 * q, eta))
+
+    lines.append("ETA " + ", ".join(etas))
+
+    lines.append(
+        "runtime mean {} p50 {} p90 {} ({} tasks), {:.2f} running".format(
+            sec_to_str(mean), sec_to_str(state.quantile(0.5)),
+            sec_to_str(state.quantile(0.9)), every[3], busy
+        )
+    )
+
+    wids = {}
+
+    for wid, amount, _ in recent:
+        wids[wid] = wids.get(wid, 0) + amount
+
+    rates = sorted(wids.items(), key=lambda x: (-x[1], x[0]))
+
+    lines.append("recent {:.2f} / s, {} workers: {}".format(
+        window_rate(samples), len(rates), ", ".join(
+            "{} = {:.2f} / s".format(wid, amount / span)
+                for wid, amount in rates[ : config.max_rates ]
+        )
+    ))
+
+    pending = sorted(
+        ( ( left * gmean, group, left, gmean )
+            for group, ( left, gmean ) in work.items() if left ),
+        reverse=True
+    )
+
+    for left_work, group, left, gmean in pending[ : config.max_groups ]:
+        lines.append("  {}: {} left, mean {}, work {}".format(
+            group, left, sec_to_str(gmean), sec_to_str(left_work)
+        ))
+
+    return "\n".join(lines)
+
 argparser = argparse.ArgumentParser(prog=os.path.basename(__file__))
 
 argparser.add_argument("-refresh", type=float, default=1.0)
 argparser.add_argument("-report", action="store_true")
+argparser.add_argument("-eta", action="store_true")
+argparser.add_argument("-breakdown", action="store_true")
 argparser.add_argument("-no-print", action="store_false", dest="print")
 
 def main (argv):
     args = argparser.parse_args(argv)
+    shard_files = shards.files(shards.count())
 
-    if args.report:
-        out = ""
+    shards.load_layout(len(shard_files))
+    alist.mkfile(config.files.progress)
 
-        with open(config.files.progress, "rb") as file:
-            data = file.read(struct.calcsize(config.pro_format))
-            data = struct.unpack(config.pro_format, data)
-            count, total, start_size, start_time = data
+    if args.report:
+        count, total = read_counts(shard_files)
+        now = time.time()
 
-            delta = count - start_size
+        with open(config.files.progress, "rb+") as file:
+            try:
+                with flock.flock(file, block=False):
+                    head, samples = record(file, count, total, now)
 
-            perc = 100 * count / total
-            per_sec = delta / (time.time() - start_time)
-            eta = sec_to_str((total - count) / per_sec) if per_sec else "-"
+            except flock.LockedException:
+                head, samples = read_history(file)
 
-            out = "{} / {} = {:.2f}% ".format(count, total, perc)
+        out = report_line(count, total, head, now)
 
-            if count != total:
-                out += "({:.2f} / s) ETA: {}".format(per_sec, eta)
-            else:
-                out += "\033[1mdone\033[0m"
+        if args.eta or args.breakdown:
+            state = breakdown.update(shard_files, now)
 
-            if args.print:
-                print(out)
+        if args.eta:
+            out += "\n" + estimate(state, samples, now)
 
-        return out
+        if args.breakdown:
+            out += "\n" + breakdown.report(state)
 
-    start_time = time.time()
-    mem_access = mmap.ACCESS_READ
-    start_size = 0
-    first_work = 0
+        if args.print:
+            print(out)
 
-    with open(config.files.done, "rb") as done, \
-         open(config.files.progress, "wb+") as prog:
+        return out
 
+    with open(config.files.progress, "rb+") as prog:
         with flock.flock(prog, block=False):
             try:
                 while True:
-                    count = first_work // config.one_size
-                    fsize = os.path.getsize(config.files.done)
-                    total = fsize // config.one_size
-                    done_fn = done.fileno()
-
-                    with mmap.mmap(done_fn, 0, access=mem_access) as mem:
-                        prev = first_work
-                        found_work = False
-
-                        for s, e in util.iter_done(mem, start=first_work):
-                            count += 1
-
-                            if not found_work:
-                                found_work = prev != s
-
-                                if not found_work:
-                                    prev = e
-
-                        first_work = prev
-
-                    start_size = start_size or count
-
-                    prog.seek(0, os.SEEK_SET)
-                    prog.write(struct.pack(
-                        config.pro_format, count, total, start_size, start_time
-                    ))
-                    alist.commit(prog)
+                    count, total = read_counts(shard_files)
+                    record(prog, count, total, time.time())
 
                     if count == total:
                         break
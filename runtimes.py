@@ -0,0 +1,55 @@
+import os
+import struct
+
+import alist
+import flock
+import config
+
+
+record_size = struct.calcsize(config.runtime_format)
+
+def append (fname, records):
+    if not records:
+        return
+
+    data = b"".join(
+        struct.pack(config.runtime_format, *record) for record in records
+    )
+
+    alist.mkfile(fname)
+
+    with open(fname, "ab") as file:
+        with flock.flock(file):
+            file.write(data)
+            file.flush()
+
+def read_from (fname, offset):
+    try:
+        with open(fname, "rb") as file:
+            with flock.flock(file, shared=True):
+                file.seek(offset, os.SEEK_SET)
+                data = file.read()
+
+    except FileNotFoundError:
+        return [], 0
+
+    data = data[ : len(data) - len(data) % record_size ]
+
+    return list(struct.iter_unpack(config.runtime_format, data)), \
+        offset + len(data)
+
+def read (fname, since=0):
+    try:
+        with open(fname, "rb") as file:
+            with flock.flock(file, shared=True):
+                data = file.read()
+
+    except FileNotFoundError:
+        return []
+
+    data = data[ : len(data) - len(data) % record_size ]
+
+    return [
+        record for record in struct.iter_unpack(config.runtime_format, data)
+            if record[2] >= since
+    ]
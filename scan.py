@@ -0,0 +1,119 @@
+import config
+import util
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+FREE = 0
+CLAIMED = 1
+DONE = 2
+
+def slot_rows (mem, start, end):
+    size = config.slot.size
+    data = np.frombuffer(
+        mem, np.uint8, (end - start) * size, util.slot_offset(start)
+    )
+
+    return data.reshape(end - start, size)
+
+def slot_fields (rows):
+    order = "<" if config.use_order == "little" else ">"
+    ident = order + "u{}".format(config.slot.width)
+
+    return rows[ :, 0 ].copy(), rows[ :, 1 : ].copy().view(ident).ravel()
+
+def slot_masks (first, ident):
+    sep = first == config.sep_byte[0]
+    done = np.iinfo(ident.dtype).max
+
+    return sep & (ident == 0), sep & (ident == done)
+
+def slot_states (first, ident):
+    free, done = slot_masks(first, ident)
+
+    return 1 + done.view(np.int8) - free.view(np.int8)
+
+def counts (mem, start, end):
+    if end <= start:
+        return [ 0, 0, 0 ]
+
+    data = mem[ util.slot_offset(start) : util.slot_offset(end) ]
+    free = data.count(config.slot.sep_free)
+    done = data.count(config.slot.sep_done)
+
+    return [ free, end - start - free - done, done ]
+
+def select (mem, start, end, state, limit=None):
+    if end <= start or limit is not None and limit <= 0:
+        return []
+
+    if np is not None:
+        states = slot_states(*slot_fields(slot_rows(mem, start, end)))
+        found = np.flatnonzero(states == state)[ : limit ]
+
+        return (found + start).tolist()
+
+    if state == CLAIMED:
+        return [ local for local, _, _ in owners(mem, start, end, limit) ]
+
+    sep = config.slot.sep_free if state == FREE else config.slot.sep_done
+    found = util.iter_bytes(
+        mem, sep, util.slot_offset(start), util.slot_offset(end),
+        len(mem) if limit is None else limit
+    )
+
+    return [ util.slot_index(pos) for pos, _ in found ]
+
+def owners (mem, start, end, limit=None):
+    if end <= start or limit is not None and limit <= 0:
+        return []
+
+    if np is not None:
+        first, ident = slot_fields(slot_rows(mem, start, end))
+        found = np.flatnonzero(slot_states(first, ident) == CLAIMED)[ : limit ]
+
+        return list(zip(
+            (found + start).tolist(), ident[found].tolist(),
+            (first[found] == config.run_byte[0]).tolist()
+        ))
+
+    result = []
+    run = config.slot.sep_run
+
+    for pos, end in util.iter_work(
+        mem, util.slot_offset(start), util.slot_offset(end)
+    ):
+        if mem[ pos : end ] == config.slot.sep_free:
+            continue
+
+        oth = int.from_bytes(mem[ pos + 1 : end ], config.use_order)
+        running = run != config.sep_byte and mem[ pos : pos + 1 ] == run
+        result.append(( util.slot_index(pos), oth, running ))
+
+        if limit is not None and len(result) >= limit:
+            break
+
+    return result
+
+def release (mem, start, end):
+    if end <= start:
+        return 0
+
+    if np is not None:
+        rows = slot_rows(mem, start, end)
+        claimed = slot_states(*slot_fields(rows)) == CLAIMED
+        rows[claimed] = np.frombuffer(config.slot.sep_free, np.uint8)
+
+        return int(claimed.sum())
+
+    begin, stop = util.slot_offset(start), util.slot_offset(end)
+    amount = counts(mem, start, end)[CLAIMED]
+
+    mem[ begin : stop ] = util.work_regex().sub(
+        lambda _: config.slot.sep_free, mem[ begin : stop ]
+    )
+
+    return amount
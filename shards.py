@@ -0,0 +1,68 @@
+import os
+import struct
+
+import util
+import alist
+import config
+
+
+def count ():
+    try:
+        with open(config.files.shards, "rb") as file:
+            data = file.read(struct.calcsize(config.shard_format))
+
+    except FileNotFoundError:
+        return 1
+
+    if not data:
+        return 1
+
+    return max(1, struct.unpack(config.shard_format, data)[0])
+
+def save (num):
+    alist.mkfile(config.files.shards)
+
+    with open(config.files.shards, "rb+") as file:
+        file.seek(0, os.SEEK_SET)
+        file.write(struct.pack(config.shard_format, num))
+        file.truncate()
+        alist.commit(file)
+
+def files (num):
+    if num == 1:
+        return [ ( config.files.done, config.files.summary ) ]
+
+    return [
+        (
+            "{}.{}".format(config.files.done, shard),
+            "{}.{}".format(config.files.summary, shard)
+        )
+            for shard in range(num)
+    ]
+
+def start_name (done_path):
+    return done_path + ".start"
+
+def locate (pos, num):
+    return pos % num, pos // num
+
+def position (shard, local, num):
+    return local * num + shard
+
+def size (shard, total, num):
+    return max(0, (total - shard + num - 1) // num)
+
+def load_layout (num=None):
+    try:
+        with open(files(num or count())[0][0], "rb") as file:
+            head = util.read_head(file)
+
+    except FileNotFoundError:
+        return False
+
+    if head is None:
+        return False
+
+    config.set_layout(*head)
+
+    return True
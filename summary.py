@@ -0,0 +1,227 @@
+import os
+import mmap
+import struct
+
+import scan
+import util
+import alist
+import config
+
+
+FREE = scan.FREE
+CLAIMED = scan.CLAIMED
+DONE = scan.DONE
+
+head_size = struct.calcsize(config.sum_head)
+block_size = struct.calcsize(config.sum_block)
+
+def num_blocks (total):
+    return -(-total // config.block_slots)
+
+def block_range (block, total):
+    start = block * config.block_slots
+    return start, min(start + config.block_slots, total)
+
+def slot_state (mem, pos):
+    fpos = util.slot_offset(pos)
+    slot = mem[ fpos : fpos + config.slot.size ]
+
+    if slot == config.slot.sep_free:
+        return FREE
+
+    if slot == config.slot.sep_done:
+        return DONE
+
+    return CLAIMED
+
+def read_totals (fname):
+    try:
+        with open(fname, "rb") as file:
+            data = file.read(head_size)
+            fsize = os.fstat(file.fileno()).st_size
+    except FileNotFoundError:
+        return None
+
+    if len(data) < head_size:
+        return None
+
+    covered, _, *counts = struct.unpack(config.sum_head, data)
+
+    if fsize != head_size + num_blocks(covered) * block_size:
+        return None
+
+    return covered, counts
+
+def read_blocks (fname, state):
+    try:
+        with open(fname, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+
+    if len(data) < head_size:
+        return None
+
+    covered = struct.unpack_from(config.sum_head, data, 0)[0]
+
+    if len(data) != head_size + num_blocks(covered) * block_size:
+        return None
+
+    blocks = struct.iter_unpack(config.sum_block, data[ head_size : ])
+
+    return covered, [ counts[state] for counts in blocks ]
+
+class summary (object):
+
+    __slots__ = [ "file", "mem" ]
+
+    def __init__ (self, fname):
+        alist.mkfile(fname)
+        self.file = open(fname, "rb+")
+        self.mem = None
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, *_):
+        self.close()
+
+    def close (self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+        self.file.close()
+
+    def resize_map (self, size):
+        if self.mem is not None:
+            self.mem.close()
+
+        self.mem = mmap.mmap(self.file.fileno(), size)
+
+    def resize (self, total, clear=False):
+        size = head_size + num_blocks(total) * block_size
+
+        if self.mem is not None:
+            if len(self.mem) == size and not clear:
+                return
+
+            self.mem.close()
+            self.mem = None
+
+        if clear:
+            os.ftruncate(self.file.fileno(), 0)
+
+        os.ftruncate(self.file.fileno(), size)
+        self.resize_map(size)
+
+    @property
+    def covered (self):
+        return struct.unpack_from(config.sum_head, self.mem, 0)[0]
+
+    @property
+    def low (self):
+        return struct.unpack_from(config.sum_head, self.mem, 0)[1]
+
+    @property
+    def counts (self):
+        return list(struct.unpack_from(config.sum_head, self.mem, 0)[ 2 : ])
+
+    def set_head (self, covered, low, counts=None):
+        counts = self.counts if counts is None else counts
+        struct.pack_into(config.sum_head, self.mem, 0, covered, low, *counts)
+
+    def get (self, block):
+        offset = head_size + block * block_size
+        return list(struct.unpack_from(config.sum_block, self.mem, offset))
+
+    def put (self, block, counts):
+        offset = head_size + block * block_size
+        struct.pack_into(config.sum_block, self.mem, offset, *counts)
+
+    def sync (self, mem, rebuild=False):
+        total = util.slot_count(len(mem))
+        fsize = os.fstat(self.file.fileno()).st_size
+        covered = low = 0
+
+        if fsize >= head_size and not rebuild:
+            if self.mem is None or len(self.mem) != fsize:
+                self.resize_map(fsize)
+
+            covered, low = self.covered, self.low
+            rebuild = (
+                covered > total or
+                fsize != head_size + num_blocks(covered) * block_size
+            )
+
+        if rebuild:
+            covered = low = 0
+
+        self.resize(total, clear=rebuild)
+        totals = self.counts
+
+        while covered < total:
+            block = covered // config.block_slots
+            end = block_range(block, total)[1]
+            counts = self.get(block)
+
+            for state, amount in enumerate(scan.counts(mem, covered, end)):
+                counts[state] += amount
+                totals[state] += amount
+
+            self.put(block, counts)
+            covered = end
+
+        self.set_head(total, self.advance(mem, low, total), totals)
+
+    def advance (self, mem, low, total):
+        while low < total:
+            block = low // config.block_slots
+            start, end = block_range(block, total)
+
+            if self.get(block)[DONE] == end - start:
+                low = end
+                continue
+
+            if slot_state(mem, low) != DONE:
+                break
+
+            low += 1
+
+        return low
+
+    def move (self, pos, old, new):
+        if old == new:
+            return
+
+        block = pos // config.block_slots
+        counts = self.get(block)
+        counts[old] -= 1
+        counts[new] += 1
+        self.put(block, counts)
+
+        totals = self.counts
+        totals[old] -= 1
+        totals[new] += 1
+        self.set_head(self.covered, self.low, totals)
+
+    def write (self, mem, pos, slot):
+        fpos = util.slot_offset(pos)
+        old = slot_state(mem, pos)
+        mem[ fpos : fpos + config.slot.size ] = slot
+        new = slot_state(mem, pos)
+
+        self.move(pos, old, new)
+
+        if new == DONE and pos == self.low:
+            self.set_head(self.covered, self.advance(mem, pos, self.covered))
+
+    def blocks (self, state):
+        total = self.covered
+
+        for block in range(self.low // config.block_slots, num_blocks(total)):
+            if self.get(block)[state]:
+                yield block_range(block, total)
+
+    def totals (self):
+        return self.counts
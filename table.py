@@ -0,0 +1,380 @@
+import os
+import time
+import pickle
+import struct
+
+import alist
+import flock
+import config
+
+
+head_size = struct.calcsize(config.queue_head)
+cell_size = struct.calcsize(config.queue_cell)
+cell_limit = (1 << (8 * cell_size)) - 1
+
+def dict_name (fname):
+    return fname + ".dict"
+
+def row_cells (width, version=config.queue_version):
+    return width + (version > 1)
+
+def row_format (width, version=config.queue_version):
+    return "<{}{}".format(row_cells(width, version), config.queue_cell)
+
+def row_size (width, version=config.queue_version):
+    return row_cells(width, version) * cell_size
+
+def is_table (file):
+    return os.pread(file.fileno(), len(config.queue_magic), 0) == \
+        config.queue_magic
+
+def has_table (fname):
+    with open(fname, "rb") as file:
+        return is_table(file)
+
+def read_head (file):
+    data = os.pread(file.fileno(), head_size, 0)
+
+    if len(data) < head_size:
+        return None
+
+    magic, version, width, generation = struct.unpack(config.queue_head, data)
+
+    if magic != config.queue_magic or version > config.queue_version:
+        raise Exception("Unknown queue format in `{}`.".format(file.name))
+
+    return width, generation, version
+
+def write_head (file, width, generation):
+    os.pwrite(file.fileno(), struct.pack(
+        config.queue_head, config.queue_magic, config.queue_version,
+        width, generation
+    ), 0)
+
+class codec (object):
+
+    __slots__ = [ "keys", "values", "orders", "lookup", "order_ids" ]
+
+    def __init__ (self, keys=(), values=(), orders=()):
+        self.keys = list(keys)
+        self.values = [ list(vals) for vals in values ]
+        self.orders = [ tuple(order) for order in orders ]
+
+        self.lookup = {
+            key : ( index, {
+                pickle.dumps(val, protocol=4) : pos
+                    for pos, val in enumerate(vals)
+            } )
+                for index, ( key, vals ) in enumerate(zip(keys, values))
+        }
+
+        self.order_ids = {
+            order : pos + 1 for pos, order in enumerate(self.orders)
+        }
+
+    @staticmethod
+    def load (fname):
+        try:
+            with open(fname, "rb") as file:
+                return codec(*pickle.load(file))
+
+        except (FileNotFoundError, EOFError):
+            return codec()
+
+    def save (self, fname):
+        temp = fname + ".tmp"
+
+        with open(temp, "wb") as file:
+            pickle.dump(( self.keys, self.values, self.orders ), file)
+            alist.commit(file)
+
+        os.replace(temp, fname)
+
+    def extends (self, other):
+        if self.orders[ : len(other.orders) ] != other.orders:
+            return False
+
+        for key, ( index, lookup ) in other.lookup.items():
+            found = self.lookup.get(key)
+
+            if found is None or found[0] != index:
+                return False
+
+            if any(found[1].get(data) != pos for data, pos in lookup.items()):
+                return False
+
+        return True
+
+    def order_id (self, order):
+        if list(order) == sorted(order):
+            return 0
+
+        if order not in self.order_ids:
+            if len(self.orders) >= cell_limit:
+                raise Exception("Too many parameter orders in the queue.")
+
+            self.orders.append(order)
+            self.order_ids[order] = len(self.orders)
+
+        return self.order_ids[order]
+
+    def intern (self, task):
+        cells = {}
+        order = []
+
+        for key, val in task:
+            if key not in self.lookup:
+                self.lookup[key] = ( len(self.keys), {} )
+                self.keys.append(key)
+                self.values.append([])
+
+            index, lookup = self.lookup[key]
+            data = pickle.dumps(val, protocol=4)
+
+            if data not in lookup:
+                if len(lookup) >= cell_limit:
+                    raise Exception(
+                        "Too many values for parameter `{}`.".format(key)
+                    )
+
+                lookup[data] = len(self.values[index])
+                self.values[index].append(val)
+
+            cells[index] = lookup[data] + 1
+            order.append(index)
+
+        return self.order_id(tuple(order)), cells
+
+    def pack (self, row, width):
+        order, cells = row
+
+        return struct.pack(
+            row_format(width), order,
+            *( cells.get(i, 0) for i in range(width) )
+        )
+
+    def decode (self, row, width, version=config.queue_version):
+        cells = struct.unpack(row_format(width, version), row)
+        order = 0
+
+        if version > 1:
+            order, *cells = cells
+
+        indices = self.orders[order - 1] if order else range(width)
+
+        return tuple(
+            ( self.keys[i], self.values[i][cells[i] - 1] )
+                for i in indices if cells[i]
+        )
+
+def rewrite_locked (file, width, new_width, generation, version):
+    size = os.fstat(file.fileno()).st_size
+    old_size = row_size(width, version)
+    lead = b"\x00" * (row_size(0) - row_size(0, version))
+    pad = b"\x00" * (row_size(new_width) - old_size - len(lead))
+
+    data = os.pread(file.fileno(), size - head_size, head_size)
+    rows = bytearray()
+
+    if width:
+        for offset in range(0, len(data) - old_size + 1, old_size):
+            rows += lead + data[ offset : offset + old_size ] + pad
+
+    file.truncate(head_size)
+    write_head(file, new_width, generation + 1)
+    os.pwrite(file.fileno(), bytes(rows), head_size)
+
+def count_locked (file):
+    head = read_head(file) if is_table(file) else None
+
+    if head is None:
+        count = alist.index_count(file)
+        return len(alist.scan_locked(file)) if count is None else count
+
+    width, _, version = head
+    size = os.fstat(file.fileno()).st_size
+
+    return (size - head_size) // row_size(width, version) if width else 0
+
+def records_locked (file, start, end):
+    if not is_table(file):
+        position = file.tell()
+        file.seek(start, os.SEEK_SET)
+
+        while file.tell() < end:
+            yield pickle.load(file)
+
+        file.seek(position, os.SEEK_SET)
+        return
+
+    width, _, version = read_head(file)
+    book = codec.load(dict_name(file.name))
+    size = row_size(width, version)
+    start = max(start, head_size)
+
+    if not size or end <= start:
+        return
+
+    data = os.pread(file.fileno(), end - start, start)
+
+    for offset in range(0, len(data) - size + 1, size):
+        yield book.decode(data[ offset : offset + size ], width, version)
+
+def write_locked (file, *data, flush=True, keys=None, compact=None):
+    compact = config.queue_format == "table" if compact is None else compact
+    size = os.fstat(file.fileno()).st_size
+
+    if size and not is_table(file) or not size and not compact:
+        file.seek(0, os.SEEK_END)
+        return alist.write_locked(file, *data, flush=flush, keys=keys)
+
+    if keys is not None:
+        keys.sync_locked(file, size)
+
+    book = codec.load(dict_name(file.name))
+    head = read_head(file)
+    width, generation, version = (
+        ( 0, time.time_ns(), config.queue_version ) if head is None else head
+    )
+
+    cells = [ book.intern(task) for task in data ]
+
+    if head is None:
+        write_head(file, len(book.keys), generation)
+
+    elif len(book.keys) > width or version < config.queue_version:
+        rewrite_locked(file, width, len(book.keys), generation, version)
+
+        if keys is not None:
+            keys.reset()
+            keys.sync_locked(file, os.fstat(file.fileno()).st_size)
+
+    width = len(book.keys)
+    book.save(dict_name(file.name))
+
+    file.seek(0, os.SEEK_END)
+    file.write(b"".join(book.pack(row, width) for row in cells))
+
+    if flush:
+        alist.commit(file)
+
+    if keys is not None:
+        keys.extend(data, file.tell())
+
+        if flush:
+            keys.flush()
+
+    return len(data)
+
+class view (object):
+
+    __slots__ = [
+        "fname", "count", "width", "generation", "version", "book", "stamp",
+        "cache", "shared", "mem"
+    ]
+
+    def __init__ (self, fname, shared=False):
+        self.fname = fname
+        self.count = 0
+        self.width = None
+        self.generation = None
+        self.version = config.queue_version
+        self.book = None
+        self.stamp = None
+        self.cache = {}
+        self.shared = shared
+        self.mem = None
+
+        self.refresh()
+
+    def refresh (self):
+        with open(self.fname, "rb") as file:
+            with flock.flock(file, shared=True):
+                head = read_head(file) if is_table(file) else None
+
+                if head is None:
+                    self.count = 0
+                    self.generation = None
+                    self.cache = {}
+
+                    return True
+
+                width, generation, version = head
+                book = self.book
+                stamp = alist.stamp(dict_name(self.fname))
+
+                if generation != self.generation or stamp != self.stamp:
+                    book = codec.load(dict_name(self.fname))
+
+                size = os.fstat(file.fileno()).st_size
+                count = (
+                    (size - head_size) // row_size(width, version)
+                        if width else 0
+                )
+
+        rewritten = generation != self.generation or count < self.count or \
+            self.book is not None and not book.extends(self.book)
+
+        self.book = book
+        self.stamp = stamp
+        self.width = width
+        self.generation = generation
+        self.version = version
+        self.count = count
+
+        if rewritten:
+            self.cache = {}
+
+        return rewritten
+
+    def select (self, positions):
+        self.cache = {
+            pos : self.cache[pos] for pos in positions if pos in self.cache
+        }
+
+        missing = sorted(set(positions).difference(self.cache))
+
+        if not missing:
+            return
+
+        size = row_size(self.width, self.version)
+
+        with open(self.fname, "rb") as file:
+            with flock.flock(file, shared=True):
+                if self.shared:
+                    self.mem = alist.remap(file, self.mem)
+
+                for pos in missing:
+                    offset = head_size + pos * size
+
+                    if self.mem is None:
+                        row = os.pread(file.fileno(), size, offset)
+                    else:
+                        row = self.mem[ offset : offset + size ]
+
+                    self.cache[pos] = self.book.decode(
+                        row, self.width, self.version
+                    )
+
+    def close (self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+    def __len__ (self):
+        return self.count
+
+    def __getitem__ (self, pos):
+        if pos not in self.cache:
+            self.select([ *self.cache, pos ])
+
+        return self.cache[pos]
+
+def open_view (fname, shared=None):
+    shared = config.shared_queue if shared is None else shared
+    alist.mkfile(fname)
+
+    if has_table(fname):
+        return view(fname, shared)
+
+    return alist.view(fname, shared)
@@ -7,10 +7,10 @@ import time
 import queue
 import shutil
 import tempfile
-import subprocess
 import threading
 import multiprocessing as mp
 
+import logs
 import config
 import watch
 import generate
@@ -35,13 +35,9 @@ def progress_thread ():
     progress.main([ "-refresh", "1" ])
 
 def watch_function ():
-    prog = progress.main([ "-report", "-no-print" ])
+    prog = progress.main([ "-report", "-breakdown", "-no-print" ])
 
-    tail = subprocess.run(
-        [ "tail", "-n", "20", config.files.log ],
-        stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
-        universal_newlines = True
-    ).stdout
+    tail = logs.tail(20)
 
     return "{}\n\n{}".format(prog, tail)
 
@@ -1,28 +1,161 @@
+import os
 import re
 import math
+import mmap
+import random
+import struct
+import contextlib
 
 import config
 
 
-re_work = re.compile(
-    config.sep_byte + b"(?!" + config.done + b")" + (b"." * config.use_bytes),
-    re.S
-)
+re_work = {}
+
+def work_regex ():
+    key = config.slot.width, config.slot.sep_run
+
+    if key not in re_work:
+        seps = re.escape(config.sep_byte) + re.escape(config.slot.sep_run)
+
+        re_work[key] = re.compile(
+            b"[" + seps + b"](?!" + config.slot.done + b")" +
+                (b"." * config.slot.width),
+            re.S
+        )
+
+    return re_work[key]
+
+def slot_offset (pos):
+    return config.slot.head + pos * config.slot.size
+
+def slot_index (offset):
+    return (offset - config.slot.head) // config.slot.size
+
+def slot_count (size):
+    return max(0, slot_index(size))
+
+def pack_head (width, version=config.done_version):
+    return struct.pack(config.done_head, config.done_magic, version, width)
+
+def read_head (file):
+    file.seek(0, os.SEEK_SET)
+    data = file.read(struct.calcsize(config.done_head))
+
+    if not data:
+        return None
+
+    if data[ : len(config.sep_byte) ] == config.sep_byte:
+        return 0, 2
+
+    magic, version, width = struct.unpack(config.done_head, data)
+
+    if magic != config.done_magic or version > config.done_version:
+        raise Exception("Unknown done file format in `{}`.".format(file.name))
+
+    return version, width
+
+def write_head (file):
+    if config.slot.version:
+        file.seek(0, os.SEEK_SET)
+        file.write(pack_head(config.slot.width, config.slot.version))
+
+@contextlib.contextmanager
+def mapped (file, access=mmap.ACCESS_WRITE):
+    if os.fstat(file.fileno()).st_size == 0:
+        yield b""
+        return
+
+    with mmap.mmap(file.fileno(), 0, access=access) as mem:
+        yield mem
+
+class mapping (object):
+
+    __slots__ = [ "file", "mem" ]
+
+    def __init__ (self, fname):
+        self.file = open(fname, "rb+")
+        self.mem = None
+
+    def map (self):
+        size = os.fstat(self.file.fileno()).st_size
+
+        if self.mem is not None and len(self.mem) == size:
+            return self.mem
+
+        self.unmap()
+
+        if size:
+            self.mem = mmap.mmap(self.file.fileno(), size)
+
+        return b"" if self.mem is None else self.mem
+
+    def unmap (self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+    def close (self):
+        self.unmap()
+        self.file.close()
+
+def flush_ranges (mem, offsets, size):
+    ranges = []
+
+    for offset in sorted(offsets):
+        start = offset - offset % mmap.PAGESIZE
+        end = offset + size
+
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([ start, end ])
+
+    for start, end in ranges:
+        mem.flush(start, end - start)
+
+def permutation (size, seed=0, rounds=4):
+    if size <= 1:
+        yield from range(size)
+        return
+
+    half = ((size - 1).bit_length() + 1) // 2
+    mask = (1 << half) - 1
+    rng = random.Random(seed)
+    keys = [ rng.getrandbits(32) for _ in range(rounds) ]
+
+    def feistel (value):
+        left, right = value >> half, value & mask
+
+        for key in keys:
+            mix = ((right ^ key) * 0x9e3779b1) & 0xffffffff
+            left, right = right, left ^ ((mix ^ (mix >> 15)) & mask)
+
+        return (left << half) | right
+
+    for index in range(size):
+        index = feistel(index)
+
+        while index >= size:
+            index = feistel(index)
+
+        yield index
 
 def mapstar (func, iterator):
     for args in iterator:
         yield func(*args)
 
-def next_bytes (mem, byt, start=0, end=None):
+def next_bytes (mem, byt, start=None, end=None):
+    start = config.slot.head if start is None else start
     end = len(mem) if end is None else end
     res = mem.find(byt, start, end)
 
     if res == -1:
         return None
 
-    return res, res + config.one_size
+    return res, res + config.slot.size
 
-def iter_bytes (mem, byt, start=0, end=None, limit=math.inf):
+def iter_bytes (mem, byt, start=None, end=None, limit=math.inf):
+    start = config.slot.head if start is None else start
     end = len(mem) if end is None else end
     count = 0
 
@@ -36,31 +169,33 @@ def iter_bytes (mem, byt, start=0, end=None, limit=math.inf):
         start = pos[1]
         count += 1
 
-def next_free (mem, start=0, end=None):
-    return next_bytes(mem, config.sep_free, start, end)
+def next_free (mem, start=None, end=None):
+    return next_bytes(mem, config.slot.sep_free, start, end)
 
-def next_done (mem, start=0, end=None):
-    return next_bytes(mem, config.sep_done, start, end)
+def next_done (mem, start=None, end=None):
+    return next_bytes(mem, config.slot.sep_done, start, end)
 
-def iter_free (mem, start=0, end=None, limit=math.inf):
-    yield from iter_bytes(mem, config.sep_free, start, end, limit)
+def iter_free (mem, start=None, end=None, limit=math.inf):
+    yield from iter_bytes(mem, config.slot.sep_free, start, end, limit)
 
-def iter_done (mem, start=0, end=None, limit=math.inf):
-    yield from iter_bytes(mem, config.sep_done, start, end, limit)
+def iter_done (mem, start=None, end=None, limit=math.inf):
+    yield from iter_bytes(mem, config.slot.sep_done, start, end, limit)
 
-def next_work (mem, start=0, end=None):
+def next_work (mem, start=None, end=None):
+    start = config.slot.head if start is None else start
     end = len(mem) if end is None else end
-    mat = re_work.search(mem, start)
+    mat = work_regex().search(mem, start, end)
 
     if mat is None:
         return None
 
     return mat.span()
 
-def iter_work (mem, start=0, end=None, limit=math.inf):
+def iter_work (mem, start=None, end=None, limit=math.inf):
+    start = config.slot.head if start is None else start
     end = len(mem) if end is None else end
     count = 0
-    found = iter(re_work.finditer(mem, start, end))
+    found = iter(work_regex().finditer(mem, start, end))
 
     while count < limit:
         try:
@@ -1,174 +1,865 @@
 #!/usr/bin/env python3
 
 import os
-import mmap
+import math
 import time
-import itertools as it
+import asyncio
+import inspect
+import contextlib
+import collections as cl
+import concurrent.futures as futures
 
 import alist
 import flock
+import lease
+import table
 import config
+import notify
+import shards
+import scan
+import runtimes
 import starvation
+import summary
 import util
 
 
-def _default_wait (*_):
-    time.sleep(config.time_wait)
+def _default_wait (worker, *_):
+    worker.sleep(config.time_wait)
+
+async def _default_wait_async (worker, *_):
+    await asyncio.get_running_loop().run_in_executor(
+        None, worker.sleep, config.time_wait
+    )
 
 def _no_op (*_):
     pass
 
+class inline (object):
+
+    __slots__ = []
+
+    def submit (self, func, *args, **kwargs):
+        future = futures.Future()
+
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+        return future
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, *_):
+        pass
+
+def executor (pool, concurrency):
+    if concurrency <= 1:
+        return inline()
+
+    if pool == "process":
+        return futures.ProcessPoolExecutor(concurrency)
+
+    if pool == "thread":
+        return futures.ThreadPoolExecutor(concurrency)
+
+    raise Exception("Unknown pool `{}`.".format(pool))
+
+def flush_due (pending, backlog, last_mark, now):
+    return pending and (
+        not backlog or len(pending) >= config.num_done or
+        now - last_mark >= config.time_done
+    )
+
+def take_batch (backlog, done, pending, amount):
+    batch = []
+
+    while backlog and len(batch) < amount:
+        pos, rea = backlog.popleft()
+
+        if pos in done:
+            pending.append(pos)
+        else:
+            batch.append(( pos, rea ))
+
+    return batch
+
+class claim_policy (object):
+
+    __slots__ = [ "num_tasks", "concurrency", "adaptive", "runtime" ]
+
+    def __init__ (self, num_tasks, concurrency, adaptive):
+        self.num_tasks = num_tasks
+        self.concurrency = max(1, concurrency)
+        self.adaptive = adaptive
+        self.runtime = None
+
+    def sample (self, runtime):
+        if self.runtime is None:
+            self.runtime = runtime
+        else:
+            alpha = config.claim_alpha
+            self.runtime = alpha * runtime + (1 - alpha) * self.runtime
+
+    def size (self, free=None, busy=None):
+        if not self.adaptive:
+            return self.num_tasks
+
+        size = self.num_tasks
+
+        if self.runtime is not None:
+            rate = self.concurrency / max(self.runtime, 1e-6)
+            size = int(config.time_batch * rate)
+
+        if free is not None:
+            owners = 1 + len(busy or ())
+            size = min(size, math.ceil(free / owners))
+
+        return max(config.min_tasks, min(size, config.max_tasks))
+
+    def straggle_age (self):
+        if self.runtime is None:
+            return config.time_straggle
+
+        return max(config.time_straggle, config.straggle_factor * self.runtime)
+
+class holder (object):
+
+    __slots__ = [ "path", "file", "lock" ]
+
+    def __init__ (self, path):
+        self.path = path
+        self.file = None
+        self.lock = None
+
+    def touch (self):
+        pass
+
+    def __enter__ (self):
+        alist.mkfile(self.path)
+        self.file = open(self.path, "rb+")
+        self.lock = flock.flock(self.file)
+        self.lock.lock()
+
+        return self
+
+    def __exit__ (self, *_):
+        self.lock.unlock()
+        self.file.close()
+
+class remote (object):
+
+    __slots__ = [ "id" ]
+
+    def __init__ (self, wid):
+        self.id = wid
+
 class worker (object):
 
-    __slots__ = [ "id", "data", "last_edit" ]
+    __slots__ = [
+        "id", "data", "last_edit", "shards", "maps", "active", "alive",
+        "free", "leases", "starts", "events"
+    ]
 
-    def fix_size (self, file):
+    def reload (self):
         mtime = os.path.getmtime(config.files.data)
 
         if mtime != self.last_edit:
-            self.data = None
-            self.data = alist.read(config.files.data)
+            if self.data is None or not len(self.data) or \
+               isinstance(self.data, table.view) != \
+               table.has_table(config.files.data):
+
+                if self.data is not None:
+                    self.data.close()
+
+                self.data = table.open_view(config.files.data)
+            else:
+                self.data.refresh()
+
+            self.shards = shards.files(shards.count())
+            shards.load_layout(len(self.shards))
             self.last_edit = mtime
 
+    def fix_size (self, file, shard):
+        self.reload()
+
+        num = len(self.shards)
         fsize = os.path.getsize(file.name)
-        req_size = config.one_size * len(self.data)
+        req_size = util.slot_offset(shards.size(shard, len(self.data), num))
+
+        if not fsize:
+            util.write_head(file)
+            fsize = config.slot.head
 
         if fsize < req_size:
             file.seek(0, os.SEEK_END)
 
-            for _ in range((req_size - fsize) // config.one_size):
-                file.write(config.sep_free)
+            for _ in range((req_size - fsize) // config.slot.size):
+                file.write(config.slot.sep_free)
 
             alist.commit(file)
 
-    def fetch_work (self, file, num_tasks):
+    def shard_map (self, shard):
+        done_path, summary_path = self.shards[shard]
+
+        if done_path not in self.maps:
+            alist.mkfile(done_path)
+
+            self.maps[done_path] = (
+                util.mapping(done_path), summary.summary(summary_path)
+            )
+
+        return self.maps[done_path]
+
+    def start_table (self, shard):
+        done_path = self.shards[shard][0]
+
+        if done_path not in self.starts:
+            self.starts[done_path] = lease.table(shards.start_name(done_path))
+
+        return self.starts[done_path]
+
+    def close (self):
+        for mapping, summ in self.maps.values():
+            mapping.close()
+            summ.close()
+
+        for starts in self.starts.values():
+            starts.close()
+
+        self.maps.clear()
+        self.starts.clear()
+
+        if self.leases is not None:
+            self.leases.close()
+            self.leases = None
+
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+
+        if self.data is not None:
+            self.data.close()
+
+    def watch (self):
+        if self.events is None:
+            fnames = [ config.files.data, config.files.events ]
+            fnames.extend(done_path for done_path, _ in self.shards)
+            dirs = [ config.paths.lock ] if config.liveness == "flock" else []
+
+            alist.mkfile(config.files.events)
+            self.events = notify.watcher(fnames, dirs)
+
+        return self.events
+
+    def sleep (self, timeout):
+        return self.watch().wait(timeout)
+
+    def hold (self):
+        if config.liveness == "lease":
+            return lease.heartbeat(self.id)
+
+        return holder(self.lock_path(self.id))
+
+    def is_alive (self, wid, alive):
+        if wid in alive:
+            return alive[wid]
+
+        if config.liveness == "lease":
+            if self.leases is None:
+                self.leases = lease.table(config.files.leases)
+
+            alive[wid] = self.leases.alive(wid, time.time())
+            return alive[wid]
+
+        now = time.monotonic()
+
+        if self.alive.get(wid, now) > now:
+            alive[wid] = True
+            return True
+
+        oth_path = self.lock_path(wid)
+        alist.mkfile(oth_path)
+
+        with open(oth_path, "rb") as oth_file:
+            lock = flock.flock(oth_file)
+            alive[wid] = not lock.try_lock()
+            lock.unlock()
+
+        if alive[wid]:
+            self.alive[wid] = now + config.time_alive
+        else:
+            self.alive.pop(wid, None)
+
+        return alive[wid]
+
+    def fetch_work (self, shard, num_tasks, alive, busy, steal=False):
         found = []
         reason = []
-        busy = []
+        mine = config.sep_byte + self.id_bytes
+        num = len(self.shards)
+
+        mapping, summ = self.shard_map(shard)
+        mem = mapping.map()
+        summ.sync(mem)
 
-        with mmap.mmap(file.fileno(), 0) as mem:
-            for start, end in util.iter_free(mem, limit=num_tasks):
+        for bstart, bend in summ.blocks(summary.FREE):
+            limit = num_tasks - len(found)
+
+            for local in scan.select(mem, bstart, bend, scan.FREE, limit):
+                summ.write(mem, local, mine)
+                found.append(shards.position(shard, local, num))
                 reason.append(( "free", 0 ))
-                found.append(start // config.one_size)
-                mem[ start + 1 : end ] = self.id_bytes
 
-            if len(found) < num_tasks:
-                for start, end in util.iter_work(mem):
-                    oth_bytes = mem[ start + 1 : end ]
-                    oth = int.from_bytes(oth_bytes, config.use_order)
+            if len(found) >= num_tasks:
+                break
+
+        taken = set(found)
+
+        if len(found) < num_tasks:
+            unstarted = {}
+
+            for bstart, bend in summ.blocks(summary.CLAIMED):
+                for local, oth, running in scan.owners(mem, bstart, bend):
                     add = oth == self.id
                     rea = "mine"
+                    pos = shards.position(shard, local, num)
+
+                    if add and (pos in self.active or pos in taken):
+                        continue
 
                     if not add:
-                        oth_path = self.lock_path(oth)
-                        alist.mkfile(oth_path)
+                        if self.is_alive(oth, alive):
+                            busy.setdefault(oth, [ pos, 0 ])[1] += 1
 
-                        with open(oth_path, "rb+") as oth_file:
-                            try:
-                                with flock.flock(oth_file, block=False):
-                                    mem[ start + 1 : end ] = self.id_bytes
-                                    add = True
-                                    rea = "dead"
+                            if not running:
+                                unstarted.setdefault(oth, []).append(local)
 
-                            except flock.LockedException:
-                                busy.append(( start // config.one_size, oth ))
+                        else:
+                            summ.write(mem, local, mine)
+                            add = True
+                            rea = "dead"
 
                     if add:
-                        found.append(start // config.one_size)
+                        found.append(pos)
                         reason.append(( rea, oth ))
 
                         if len(found) >= num_tasks:
                             break
 
-        return found, reason, busy
+                if len(found) >= num_tasks:
+                    break
 
-    def get_work (self, num_tasks):
-        alist.mkfile(config.files.done)
+            if len(found) < num_tasks and steal:
+                for local, oth in self.steal_work(
+                    mem, summ, num_tasks - len(found), unstarted, busy
+                ):
+                    found.append(shards.position(shard, local, num))
+                    reason.append(( "stolen", oth ))
+
+        self.free[shard] = summ.totals()[summary.FREE]
+
+        return found, reason
+
+    def steal_work (self, mem, summ, num_tasks, unstarted, busy):
         found = []
-        busy = []
+        mine = config.sep_byte + self.id_bytes
 
-        with open(config.files.done, "rb+") as file:
-            with flock.flock(file):
-                self.fix_size(file)
+        for oth, slots in unstarted.items():
+            amount = min((len(slots) + 1) // 2, num_tasks - len(found))
+
+            for local in slots[ len(slots) - amount : ]:
+                summ.write(mem, local, mine)
+                found.append(( local, oth ))
+
+            busy[oth][1] -= amount
+
+            if not busy[oth][1]:
+                del busy[oth]
+
+            if len(found) >= num_tasks:
+                break
 
-                found, reason, busy = self.fetch_work(file, num_tasks)
+        return found
 
-                if found:
-                    alist.commit(file)
+    def start_work (self, batch, pending):
+        if not batch or not self.tracks:
+            return batch
+
+        mine = config.sep_byte + self.id_bytes
+        running = config.slot.sep_run + self.id_bytes
+        by_shard = {}
+        owned = set()
+        now = time.time()
+
+        for pos in pending:
+            shard, local = shards.locate(pos, len(self.shards))
+            by_shard.setdefault(shard, ( [], [] ))[1].append(local)
+
+        for pos, ( rea, _ ) in batch:
+            shard, local = shards.locate(pos, len(self.shards))
+            slots = by_shard.setdefault(shard, ( [], [] ))[0]
+            slots.append(( pos, local, rea ))
+
+        for shard, ( slots, finished ) in by_shard.items():
+            mapping, summ = self.shard_map(shard)
+            starts = self.start_table(shard)
+
+            with flock.flock(mapping.file):
+                mem = mapping.map()
+                starts.map(util.slot_count(len(mem)) - 1)
+
+                if finished:
+                    self.mark_locked(mem, summ, finished)
+
+                for pos, local, rea in slots:
+                    fpos = util.slot_offset(local)
+                    slot = mem[ fpos : fpos + config.slot.size ]
+
+                    if rea == "spec":
+                        if slot != config.slot.sep_done:
+                            owned.add(pos)
+
+                        continue
+
+                    if slot == mine:
+                        mem[ fpos : fpos + config.slot.size ] = running
+                        starts.stamp(local, now)
+
+                    if slot in ( mine, running ):
+                        owned.add(pos)
+
+        pending.clear()
+
+        return [ ( pos, rea ) for pos, rea in batch if pos in owned ]
+
+    def get_stragglers (self, amount, min_age, busy):
+        found = []
+        now = time.time()
+
+        if not self.tracks:
+            return [], []
+
+        num = len(self.shards)
+
+        for shard in range(num):
+            mapping, summ = self.shard_map(shard)
+            starts = self.start_table(shard)
+
+            with flock.flock(mapping.file):
+                mem = mapping.map()
+                summ.sync(mem)
+
+                for bstart, bend in summ.blocks(summary.CLAIMED):
+                    for local, oth, running in scan.owners(mem, bstart, bend):
+                        if not running:
+                            continue
+
+                        pos = shards.position(shard, local, num)
+
+                        if oth == self.id or oth not in busy or \
+                           pos in self.active:
+                            continue
+
+                        age = now - starts.read(local)
+
+                        if age >= min_age:
+                            found.append(( age, pos, oth ))
+
+        found.sort(reverse=True)
+
+        if found:
+            skip = self.id % len(found)
+            found = (found[ skip : ] + found[ : skip ])[ : amount ]
+
+        return (
+            [ pos for _, pos, _ in found ],
+            [ ( "spec", oth ) for _, _, oth in found ]
+        )
+
+    def done_positions (self, positions):
+        result = set()
+
+        for pos in positions:
+            shard, local = shards.locate(pos, len(self.shards))
+            mem = self.shard_map(shard)[0].map()
+            fpos = util.slot_offset(local)
+
+            if mem[ fpos : fpos + config.slot.size ] == config.slot.sep_done:
+                result.add(pos)
+
+        return result
+
+    def lost_positions (self, batch):
+        return self.done_positions(pos for pos, rea in batch if rea == "spec")
+
+    def free_count (self):
+        if not self.free or not self.shards:
+            return None
+
+        known = sum(self.free.values())
+
+        return math.ceil(known * len(self.shards) / len(self.free))
+
+    def get_work (self, num_tasks):
+        alive = {}
+        passes = [ False ]
+
+        if config.steal and self.tracks:
+            passes.append(True)
+
+        self.reload()
+        self.watch().clear()
+
+        for steal in passes:
+            found = []
+            reason = []
+            busy = {}
+            step = 0
+
+            while not found and step < len(self.shards):
+                shard = (self.id + step) % len(self.shards)
+                file = self.shard_map(shard)[0].file
+                step += 1
+
+                with flock.flock(file):
+                    self.fix_size(file, shard)
+                    sfound, sreason = self.fetch_work(
+                        shard, num_tasks, alive, busy, steal
+                    )
+
+                    if sfound:
+                        alist.commit(file)
+
+                found.extend(sfound)
+                reason.extend(sreason)
+
+            if found:
+                break
 
         return found, reason, busy
 
     def __init__ (self):
         self.last_edit = None
+        self.data = None
+        self.shards = None
+        self.maps = {}
+        self.active = set()
+        self.alive = {}
+        self.free = {}
+        self.leases = None
+        self.starts = {}
+        self.events = None
+
+        shards.load_layout()
         alist.mkfile(config.files.wid)
 
         with open(config.files.wid, "rb+") as file:
             with flock.flock(file):
                 file.seek(0, os.SEEK_SET)
-                data = file.read(config.use_bytes)
+                data = file.read(config.wid_bytes)
                 self.id = int.from_bytes(data, config.use_order) + 1
 
+                if self.id >= (1 << (8 * config.slot.width)) - 1:
+                    raise Exception(
+                        "Worker id space of {} bytes exhausted, use "
+                        "`migrate.py` to widen it.".format(config.slot.width)
+                    )
+
+                data = self.id.to_bytes(config.wid_bytes, config.use_order)
+
                 file.seek(0, os.SEEK_SET)
-                file.write(self.id_bytes)
+                file.write(data)
 
                 alist.commit(file)
 
-    def mark_done (self, pos):
-        with open(config.files.done, "rb+") as file:
-            with mmap.mmap(file.fileno(), 0) as mem:
-                fpos = pos * config.one_size
-                mem[ fpos : fpos + config.one_size ] = config.sep_done
+    def mark_done (self, *positions):
+        by_shard = {}
+
+        for pos in positions:
+            shard, local = shards.locate(pos, len(self.shards))
+            by_shard.setdefault(shard, []).append(local)
+
+        for shard, slots in by_shard.items():
+            mapping, summ = self.shard_map(shard)
+
+            with flock.flock(mapping.file):
+                self.mark_locked(mapping.map(), summ, slots)
+
+    @contextlib.contextmanager
+    def flushing (self, pending, timings):
+        try:
+            yield
+        finally:
+            self.mark_done(*pending)
+            runtimes.append(config.files.runtimes, timings)
+
+    def mark_locked (self, mem, summ, slots, flush=True):
+        summ.sync(mem)
+
+        for local in slots:
+            summ.write(mem, local, config.slot.sep_done)
+
+        if flush:
+            util.flush_ranges(mem, (
+                util.slot_offset(local) for local in slots
+            ), config.slot.size)
 
     def work (
         self, task, *, num_tasks = config.num_tasks,
+        concurrency = config.concurrency, pool = config.pool,
+        adaptive = config.adaptive, speculate = config.speculate,
         begin = _no_op, starve = _no_op, fetch = _no_op,
         wait = _default_wait, end = _no_op,
         targs = (), tkwargs = {}, bargs = (), bkwargs = {},
         sargs = (), skwargs = {}, fargs = (), fkwargs = {},
         wargs = (), wkwargs = {}, eargs = (), ekwargs = {}
     ):
-        lock_path = self.lock_path(self.id)
-        alist.mkfile(lock_path)
-        done = []
+        done = set()
+        backlog = cl.deque()
+        running = {}
+        started = {}
+        pending = []
+        timings = []
+        last_mark = time.time()
+        policy = claim_policy(num_tasks, concurrency, adaptive)
 
         starve_func = lambda amount: starve(self, amount, *sargs, **skwargs)
         starve_check = starvation.checker(starve_func, config.time_starve)
 
-        with open(lock_path, "rb+") as file:
-            with flock.flock(file):
+        with executor(pool, concurrency) as tasks:
+            handle = self
+
+            if isinstance(tasks, futures.ProcessPoolExecutor):
+                handle = remote(self.id)
+
+            with self.hold() as held, self.flushing(pending, timings):
                 begin(self, *bargs, **bkwargs)
                 found = reason = busy = None
 
                 while True:
+                    now = time.time()
+
+                    if flush_due(pending or timings, backlog, last_mark, now):
+                        self.mark_done(*pending)
+                        runtimes.append(config.files.runtimes, timings)
+                        pending.clear()
+                        timings.clear()
+                        last_mark = now
+
+                    if not backlog and len(running) < concurrency:
+                        with starve_check:
+                            found, reason, busy = self.get_work(
+                                policy.size(self.free_count(), busy)
+                            )
+
+                        if not found and busy and speculate:
+                            found, reason = self.get_stragglers(
+                                concurrency - len(running),
+                                policy.straggle_age(), busy
+                            )
+
+                        if found:
+                            fetch(self, found, reason, *fargs, **fkwargs)
+                            self.data.select(found)
+                            backlog.extend(zip(found, reason))
+
+                        elif not running:
+                            if not busy:
+                                break
+
+                            wait(self, busy, *wargs, **wkwargs)
+                            continue
+
+                    while backlog and len(running) < concurrency:
+                        batch = take_batch(
+                            backlog, done, pending, concurrency - len(running)
+                        )
+
+                        batch = self.start_work(batch, pending)
+                        lost = self.lost_positions(batch)
+
+                        for pos, rea in batch:
+                            if pos in lost:
+                                done.add(pos)
+                                continue
+
+                            start = time.time()
+                            future = tasks.submit(
+                                task, handle, self.data[pos], pos, rea,
+                                *targs, **tkwargs
+                            )
+
+                            running[future] = pos
+                            started[future] = start
+                            self.active.add(pos)
+
+                    if running:
+                        finished, _ = futures.wait(
+                            running, return_when=futures.FIRST_COMPLETED
+                        )
+
+                        for future in finished:
+                            pos = running.pop(future)
+                            now = time.time()
+                            runtime = now - started.pop(future)
+                            policy.sample(runtime)
+                            self.active.discard(pos)
+                            future.result()
+                            done.add(pos)
+                            pending.append(pos)
+                            timings.append(( pos, self.id, now, runtime ))
+                            held.touch()
+
+            end(self, *eargs, **ekwargs)
+            self.close()
+            notify.touch()
+
+    async def work_async (
+        self, task, *, num_tasks = config.num_tasks,
+        concurrency = config.concurrency_async,
+        adaptive = config.adaptive, speculate = config.speculate,
+        begin = _no_op, starve = _no_op, fetch = _no_op,
+        wait = _default_wait_async, end = _no_op,
+        targs = (), tkwargs = {}, bargs = (), bkwargs = {},
+        sargs = (), skwargs = {}, fargs = (), fkwargs = {},
+        wargs = (), wkwargs = {}, eargs = (), ekwargs = {}
+    ):
+        loop = asyncio.get_running_loop()
+        done = set()
+        backlog = cl.deque()
+        running = {}
+        started = {}
+        pending = []
+        timings = []
+        last_mark = time.time()
+        policy = claim_policy(num_tasks, concurrency, adaptive)
+
+        starve_func = lambda amount: starve(self, amount, *sargs, **skwargs)
+        starve_check = starvation.checker(starve_func, config.time_starve)
+
+        with self.hold() as held, self.flushing(pending, timings):
+            begin(self, *bargs, **bkwargs)
+            found = reason = busy = None
+
+            while True:
+                now = time.time()
+
+                if flush_due(pending or timings, backlog, last_mark, now):
+                    await loop.run_in_executor(
+                        None, self.mark_done, *pending
+                    )
+
+                    await loop.run_in_executor(
+                        None, runtimes.append, config.files.runtimes, timings
+                    )
+
+                    pending.clear()
+                    timings.clear()
+                    last_mark = now
+
+                if not backlog and len(running) < concurrency:
                     with starve_check:
-                        found, reason, busy = self.get_work(num_tasks)
+                        found, reason, busy = await loop.run_in_executor(
+                            None, self.get_work,
+                            policy.size(self.free_count(), busy)
+                        )
 
-                    if not found:
-                        if not busy:
-                            break
+                    if not found and busy and speculate:
+                        found, reason = await loop.run_in_executor(
+                            None, self.get_stragglers,
+                            concurrency - len(running),
+                            policy.straggle_age(), busy
+                        )
 
-                        wait(self, busy, *wargs, **wkwargs)
-                        continue
+                    if found:
+                        fetch(self, found, reason, *fargs, **fkwargs)
 
-                    fetch(self, found, reason, *fargs, **fkwargs)
+                        await loop.run_in_executor(
+                            None, self.data.select, found
+                        )
 
-                    if len(self.data) > len(done):
-                        diff = len(self.data) - len(done)
-                        done.extend(it.repeat(False, diff))
+                        backlog.extend(zip(found, reason))
 
-                    for pos, rea in zip(found, reason):
-                        if not done[pos]:
-                            data = self.data[pos]
-                            task(self, data, pos, rea, *targs, **tkwargs)
-                            done[pos] = True
+                    elif not running:
+                        if not busy:
+                            break
 
-                        self.mark_done(pos)
+                        waiting = wait(self, busy, *wargs, **wkwargs)
 
-            end(self, *eargs, **ekwargs)
+                        if inspect.isawaitable(waiting):
+                            await waiting
+
+                        continue
+
+                while backlog and len(running) < concurrency:
+                    batch = take_batch(
+                        backlog, done, pending, concurrency - len(running)
+                    )
+
+                    batch = await loop.run_in_executor(
+                        None, self.start_work, batch, pending
+                    )
+
+                    lost = self.lost_positions(batch)
+
+                    for pos, rea in batch:
+                        if pos in lost:
+                            done.add(pos)
+                            continue
+
+                        start = time.time()
+                        future = asyncio.ensure_future(task(
+                            self, self.data[pos], pos, rea, *targs, **tkwargs
+                        ))
+
+                        running[future] = pos
+                        started[future] = start
+                        self.active.add(pos)
+
+                if running:
+                    finished, unfinished = await asyncio.wait(
+                        running, return_when=asyncio.FIRST_COMPLETED,
+                        timeout=config.time_wait if speculate else None
+                    )
+
+                    if speculate:
+                        lost = self.done_positions(
+                            running[future] for future in unfinished
+                        )
+
+                        for future in unfinished:
+                            if running[future] in lost:
+                                future.cancel()
+                                pos = running.pop(future)
+                                started.pop(future)
+                                self.active.discard(pos)
+                                done.add(pos)
+
+                    for future in finished:
+                        pos = running.pop(future)
+                        now = time.time()
+                        runtime = now - started.pop(future)
+                        policy.sample(runtime)
+                        self.active.discard(pos)
+                        future.result()
+                        done.add(pos)
+                        pending.append(pos)
+                        timings.append(( pos, self.id, now, runtime ))
+                        held.touch()
+
+        end(self, *eargs, **ekwargs)
+        self.close()
+        notify.touch()
 
     def lock_path (self, wid):
         return os.path.join(config.paths.lock, str(wid))
 
+    @property
+    def tracks (self):
+        return config.slot.sep_run != config.sep_byte
+
     @property
     def id_bytes (self):
-        return self.id.to_bytes(config.use_bytes, config.use_order)
+        return self.id.to_bytes(config.slot.width, config.use_order)